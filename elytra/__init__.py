@@ -10,9 +10,17 @@ A Python Library for various Microsoft APIs, including the Xbox and Bedrock Real
 """
 
 from .bedrock_realms import *
+from .cache import *
+from .chunking import *
 from .const import *
 from .core import *
+from .deadlines import *
+from .priorities import *
 from .protocols import *
+from .rate_limit import *
+from .retry_transport import *
+from .session import *
+from .token_store import *
 from .xbox import *
 
 __version__ = "0.7.3"
@@ -53,38 +53,55 @@ __all__ = (
 class BedrockRealmsAPI(BaseMicrosoftAPI):
     RELYING_PATH: str = BEDROCK_REALMS_API_URL
     BASE_URL: str = BEDROCK_REALMS_API_URL
+    HOSTS: tuple[str, ...] = (
+        "pocket.realms.minecraft.net",
+        "frontend.realms.minecraft-services.net",
+    )
 
     @property
     def base_headers(self) -> dict[str, str]:
         return {
-            "Authorization": self.auth_mgr.xsts_token.authorization_header_value,
+            "Authorization": self.xsts_token.authorization_header_value,
             "Client-Version": MC_VERSION,
             "User-Agent": "MCPE/UWP",
             "Cache-Control": "no-cache, no-store",
         }
 
     async def join_realm_from_code(self, code: str) -> FullRealm:
-        return await FullRealm.from_response(
-            await self.post(f"invites/v1/link/accept/{code}")
+        return await self.request_model(
+            FullRealm,
+            "POST",
+            f"invites/v1/link/accept/{code}",
+            endpoint="join_realm_from_code",
         )
 
     async def fetch_realm_from_code(self, code: str) -> FullRealm:
-        return await FullRealm.from_response(await self.get(f"worlds/v1/link/{code}"))
+        return await self.request_model(
+            FullRealm,
+            "GET",
+            f"worlds/v1/link/{code}",
+            endpoint="fetch_realm_from_code",
+        )
 
     async def fetch_realms(self) -> MultiRealmResponse:
-        return await MultiRealmResponse.from_response(await self.get("worlds"))
+        return await self.request_model(
+            MultiRealmResponse, "GET", "worlds", endpoint="fetch_realms"
+        )
 
     async def fetch_realm(self, realm_id: int | str) -> IndividualRealm:
-        return await IndividualRealm.from_response(await self.get(f"worlds/{realm_id}"))
+        return await self.request_model(
+            IndividualRealm, "GET", f"worlds/{realm_id}", endpoint="fetch_realm"
+        )
 
     async def invite_player(
         self, realm_id: str | int, player_xuid: str | int
     ) -> FullRealm:
-        return await FullRealm.from_response(
-            await self.put(
-                f"invites/{realm_id}/invite/update",
-                json={"invites": {str(player_xuid): "ADD"}},
-            )
+        return await self.request_model(
+            FullRealm,
+            "PUT",
+            f"invites/{realm_id}/invite/update",
+            endpoint="invite_player",
+            json={"invites": {str(player_xuid): "ADD"}},
         )
 
     async def fetch_pending_invite_count(self) -> int:
@@ -92,8 +109,11 @@ class BedrockRealmsAPI(BaseMicrosoftAPI):
         return int(await resp.aread())
 
     async def fetch_pending_invites(self) -> PendingInviteResponse:
-        return await PendingInviteResponse.from_response(
-            await self.get("invites/pending")
+        return await self.request_model(
+            PendingInviteResponse,
+            "GET",
+            "invites/pending",
+            endpoint="fetch_pending_invites",
         )
 
     async def accept_invite(self, invitation_id: str) -> None:
@@ -103,23 +123,32 @@ class BedrockRealmsAPI(BaseMicrosoftAPI):
         await self.put(f"invites/reject/{invitation_id}")
 
     async def fetch_activities(self) -> ActivityListResponse:
-        return await ActivityListResponse.from_response(
-            await self.get("activities/live/players")
+        return await self.request_model(
+            ActivityListResponse,
+            "GET",
+            "activities/live/players",
+            endpoint="fetch_activities",
         )
 
     async def leave_realm(self, realm_id: int | str) -> None:
         await self.delete(f"invites/{realm_id}")
 
     async def fetch_realm_count(self) -> RealmCountResponse:
-        return await RealmCountResponse.from_response(
-            await self.get("clubs/membercount")
+        return await self.request_model(
+            RealmCountResponse,
+            "GET",
+            "clubs/membercount",
+            endpoint="fetch_realm_count",
         )
 
     async def fetch_realm_story_settings(
         self, realm_id: str | int
     ) -> RealmStorySettings:
-        return await RealmStorySettings.from_response(
-            await self.get(f"worlds/{realm_id}/stories/settings")
+        return await self.request_model(
+            RealmStorySettings,
+            "GET",
+            f"worlds/{realm_id}/stories/settings",
+            endpoint="fetch_realm_story_settings",
         )
 
     async def update_realm_story_settings(
@@ -151,9 +180,10 @@ class BedrockRealmsAPI(BaseMicrosoftAPI):
     async def fetch_realm_story_player_activity(
         self, realm_id: str | int
     ) -> RealmStoryPlayerActivityResponse:
-        return await RealmStoryPlayerActivityResponse.from_response(
-            await self.get(
-                f"https://frontend.realms.minecraft-services.net/api/v1.0/worlds/{realm_id}/stories/playeractivity",
-                use_url_as_is=True,
-            )
+        return await self.request_model(
+            RealmStoryPlayerActivityResponse,
+            "GET",
+            f"https://frontend.realms.minecraft-services.net/api/v1.0/worlds/{realm_id}/stories/playeractivity",
+            endpoint="fetch_realm_story_player_activity",
+            use_url_as_is=True,
         )
@@ -0,0 +1,173 @@
+"""
+MIT License
+
+Copyright (c) 2023-2024 AstreaTSS
+
+Permission is hereby granted, free of charge, to any person obtaining a copy
+of this software and associated documentation files (the "Software"), to deal
+in the Software without restriction, including without limitation the rights
+to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+copies of the Software, and to permit persons to whom the Software is
+furnished to do so, subject to the following conditions:
+
+The above copyright notice and this permission notice shall be included in all
+copies or substantial portions of the Software.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+SOFTWARE.
+"""
+
+import time
+import typing
+from collections import OrderedDict
+
+import msgspec
+
+__all__ = ("CacheStats", "ResponseCache")
+
+T = typing.TypeVar("T")
+
+
+class CacheStats(msgspec.Struct, kw_only=True):
+    hits: int = 0
+    stale_hits: int = 0
+    misses: int = 0
+    evictions: int = 0
+    size: int = 0
+
+
+class _CacheEntry:
+    __slots__ = ("endpoint", "value", "expires_at", "stale_until", "revalidating")
+
+    def __init__(
+        self, endpoint: str, value: typing.Any, expires_at: float, stale_until: float
+    ) -> None:
+        self.endpoint = endpoint
+        self.value = value
+        self.expires_at = expires_at
+        self.stale_until = stale_until
+        self.revalidating = False
+
+
+class ResponseCache:
+    """
+    An in-memory cache of decoded responses.
+
+    Only endpoints with a TTL set are cached. Entries are evicted least recently
+    used first once `max_size` is reached.
+
+    For `stale_while_revalidate` seconds after an entry expires, the first caller
+    to ask for it refetches it while any concurrent callers are given the stale
+    value instead of waiting.
+
+    Cached values are shared between callers, so they should not be modified.
+
+    Args:
+        ttls: How long to cache each endpoint for, in seconds. Endpoints are named \
+            after the method that fetches them, like `fetch_realm`.
+        max_size: The maximum number of entries to keep.
+        stale_while_revalidate: How long an expired entry may still be served \
+            while it is being refetched, in seconds.
+    """
+
+    __slots__ = (
+        "ttls",
+        "max_size",
+        "stale_while_revalidate",
+        "_entries",
+        "_stats",
+    )
+
+    ttls: dict[str, float]
+    max_size: int
+    stale_while_revalidate: float
+
+    def __init__(
+        self,
+        ttls: typing.Mapping[str, float],
+        *,
+        max_size: int = 1024,
+        stale_while_revalidate: float = 0.0,
+    ) -> None:
+        self.ttls = dict(ttls)
+        self.max_size = max_size
+        self.stale_while_revalidate = stale_while_revalidate
+
+        self._entries: OrderedDict[typing.Hashable, _CacheEntry] = OrderedDict()
+        self._stats = CacheStats()
+
+    def caches(self, endpoint: typing.Optional[str]) -> bool:
+        return endpoint is not None and endpoint in self.ttls
+
+    async def get_or_fetch(
+        self,
+        endpoint: str,
+        key: typing.Hashable,
+        fetch: typing.Callable[[], typing.Awaitable[T]],
+    ) -> T:
+        if (ttl := self.ttls.get(endpoint)) is None:
+            return await fetch()
+
+        now = time.monotonic()
+        entry = self._entries.get(key)
+
+        if entry:
+            if now < entry.expires_at:
+                self._entries.move_to_end(key)
+                self._stats.hits += 1
+                return entry.value
+
+            if now < entry.stale_until:
+                if entry.revalidating:
+                    self._entries.move_to_end(key)
+                    self._stats.stale_hits += 1
+                    return entry.value
+
+                entry.revalidating = True
+
+        self._stats.misses += 1
+
+        try:
+            value = await fetch()
+        finally:
+            if entry:
+                entry.revalidating = False
+
+        self._store(endpoint, key, value, ttl)
+        return value
+
+    def _store(
+        self, endpoint: str, key: typing.Hashable, value: typing.Any, ttl: float
+    ) -> None:
+        now = time.monotonic()
+        self._entries[key] = _CacheEntry(
+            endpoint, value, now + ttl, now + ttl + self.stale_while_revalidate
+        )
+        self._entries.move_to_end(key)
+
+        while len(self._entries) > self.max_size:
+            self._entries.popitem(last=False)
+            self._stats.evictions += 1
+
+    def invalidate(self, endpoint: typing.Optional[str] = None) -> None:
+        """Remove every entry for an endpoint, or every entry if none is given."""
+        if endpoint is None:
+            self._entries.clear()
+            return
+
+        for key in [k for k, e in self._entries.items() if e.endpoint == endpoint]:
+            del self._entries[key]
+
+    def stats(self) -> CacheStats:
+        return CacheStats(
+            hits=self._stats.hits,
+            stale_hits=self._stats.stale_hits,
+            misses=self._stats.misses,
+            evictions=self._stats.evictions,
+            size=len(self._entries),
+        )
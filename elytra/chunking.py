@@ -0,0 +1,83 @@
+"""
+MIT License
+
+Copyright (c) 2023-2024 AstreaTSS
+
+Permission is hereby granted, free of charge, to any person obtaining a copy
+of this software and associated documentation files (the "Software"), to deal
+in the Software without restriction, including without limitation the rights
+to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+copies of the Software, and to permit persons to whom the Software is
+furnished to do so, subject to the following conditions:
+
+The above copyright notice and this permission notice shall be included in all
+copies or substantial portions of the Software.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+SOFTWARE.
+"""
+
+import typing
+
+import anyio
+import msgspec
+
+__all__ = ("ChunkError", "fetch_in_chunks")
+
+T = typing.TypeVar("T")
+R = typing.TypeVar("R")
+
+
+class ChunkError(msgspec.Struct, kw_only=True):
+    """A chunk of a batched request that failed, and the exception it failed with."""
+
+    items: list[typing.Any]
+    error: typing.Any
+
+
+async def fetch_in_chunks(
+    items: typing.Sequence[T],
+    fetch: typing.Callable[[list[T]], typing.Awaitable[R]],
+    *,
+    chunk_size: int,
+    max_concurrency: int,
+) -> tuple[list[R], list[ChunkError]]:
+    """
+    Split `items` into chunks of at most `chunk_size` and fetch them concurrently,
+    with at most `max_concurrency` requests running at once.
+
+    Returns the results of the chunks that succeeded, in order, and the chunks that
+    failed. If every chunk fails, the first chunk's exception is raised instead.
+    """
+    if chunk_size < 1:
+        raise ValueError("chunk_size must be at least 1.")
+
+    chunks = [list(items[i : i + chunk_size]) for i in range(0, len(items), chunk_size)]
+    if len(chunks) <= 1:
+        return [await fetch(chunks[0] if chunks else [])], []
+
+    results: list[typing.Optional[R]] = [None] * len(chunks)
+    errors: list[typing.Optional[ChunkError]] = [None] * len(chunks)
+    limiter = anyio.CapacityLimiter(max_concurrency)
+
+    async def fetch_chunk(index: int) -> None:
+        async with limiter:
+            try:
+                results[index] = await fetch(chunks[index])
+            except Exception as e:
+                errors[index] = ChunkError(items=chunks[index], error=e)
+
+    async with anyio.create_task_group() as tg:
+        for index in range(len(chunks)):
+            tg.start_soon(fetch_chunk, index)
+
+    failed = [e for e in errors if e is not None]
+    if len(failed) == len(chunks):
+        raise failed[0].error
+
+    return [r for r, e in zip(results, errors, strict=False) if e is None], failed  # type: ignore
@@ -22,16 +22,30 @@ OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
 SOFTWARE.
 """
 
+import contextlib
 import datetime
 import functools
+import sys
+import time
+import traceback
+import types
 import typing
 
+import anyio
 import httpx
 import msgspec
 import typing_extensions as typing_ext
 
-from elytra import retry_transport
-from elytra.protocols import HandlerProtocol
+from elytra.cache import ResponseCache
+from elytra.deadlines import DeadlineExceeded, deadline
+from elytra.priorities import Priority
+from elytra.protocols import HandlerProtocol, TokenStoreProtocol
+from elytra.retry_transport import RetryDecision
+from elytra.session import SessionFactory
+from elytra.token_store import FileTokenStore
+
+if sys.version_info < (3, 11):
+    from exceptiongroup import ExceptionGroup
 
 __all__ = (
     "BaseModel",
@@ -42,11 +56,16 @@ __all__ = (
     "ParsablePascalModel",
     "add_decoder",
     "OAuth2TokenResponse",
+    "StoredTokens",
     "AuthenticationManager",
     "MicrosoftAPIException",
     "BaseMicrosoftAPI",
 )
 
+DEFAULT_RENEWAL_MARGIN = 300.0
+MIN_RENEWAL_INTERVAL = 10.0
+MAX_PREPARED_HEADERS = 256
+
 
 def utc_now() -> datetime.datetime:
     return datetime.datetime.now(datetime.timezone.utc)
@@ -89,6 +108,7 @@ class ParsablePascalModel(msgspec.Struct, ParsableBase, rename="pascal", kw_only
 
 
 PM = typing.TypeVar("PM", bound=type[ParsableBase])
+PB = typing.TypeVar("PB", bound=ParsableBase)
 
 
 def add_decoder(cls: PM) -> PM:
@@ -118,13 +138,17 @@ class OAuth2TokenResponse(ParsableModel):
     user_id: typing.Optional[str] = None
     refresh_token: typing.Optional[str] = None
 
-    def is_valid(self) -> bool:
-        return (self.issued + datetime.timedelta(seconds=self.expires_in)) > utc_now()
+    @property
+    def expires_at(self) -> datetime.datetime:
+        return self.issued + datetime.timedelta(seconds=self.expires_in)
+
+    def is_valid(self, margin: float = 0) -> bool:
+        return self.expires_at - datetime.timedelta(seconds=margin) > utc_now()
 
     @classmethod
     def from_file(cls, path: str) -> typing_ext.Self:
         with open(path, "rb") as f:
-            return cls.from_bytes(f.read())
+            return StoredTokens.from_bytes(f.read()).oauth  # type: ignore
 
 
 class XTokenResponse(ParsablePascalModel):
@@ -132,8 +156,12 @@ class XTokenResponse(ParsablePascalModel):
     not_after: datetime.datetime
     token: str
 
-    def is_valid(self) -> bool:
-        return self.not_after > utc_now()
+    @property
+    def expires_at(self) -> datetime.datetime:
+        return self.not_after
+
+    def is_valid(self, margin: float = 0) -> bool:
+        return self.not_after - datetime.timedelta(seconds=margin) > utc_now()
 
 
 class DisplayClaims(BaseModel):
@@ -178,25 +206,69 @@ class XSTSResponse(XTokenResponse):
         return f"XBL3.0 x={self.userhash};{self.token}"
 
 
+@add_decoder
+class StoredTokens(ParsableModel):
+    oauth: OAuth2TokenResponse
+    user_token: typing.Optional[XAUResponse] = None
+    xsts_tokens: dict[str, XSTSResponse] = msgspec.field(default_factory=dict)
+
+    @classmethod
+    def from_bytes(cls, obj: bytes) -> typing_ext.Self:
+        try:
+            return cls._decoder.decode(obj)
+        except msgspec.ValidationError:
+            # a plain oauth.json, like the one elytra-authenticate writes
+            return cls(oauth=OAuth2TokenResponse.from_bytes(obj))
+
+
+def _should_refresh(
+    token: typing.Optional[OAuth2TokenResponse | XTokenResponse],
+    seen_token: typing.Optional[OAuth2TokenResponse | XTokenResponse],
+    force_refresh: bool,
+    margin: float,
+) -> bool:
+    if force_refresh and token is seen_token:
+        return True
+    return not (token and token.is_valid(margin))
+
+
+def _is_newer(
+    token: typing.Optional[OAuth2TokenResponse | XTokenResponse],
+    current_token: typing.Optional[OAuth2TokenResponse | XTokenResponse],
+) -> bool:
+    if not token:
+        return False
+    return not current_token or token.expires_at > current_token.expires_at
+
+
 class AuthenticationManager:
     __slots__ = (
         "session",
         "client_id",
         "client_secret",
         "relying_party",
+        "relying_parties",
+        "token_store",
+        "owns_session",
         "oauth",
         "user_token",
-        "xsts_token",
+        "xsts_tokens",
+        "_oauth_lock",
+        "_user_token_lock",
+        "_xsts_locks",
     )
 
     session: httpx.AsyncClient
     client_id: str
     client_secret: str
     relying_party: str
+    relying_parties: list[str]
+    token_store: typing.Optional[TokenStoreProtocol]
+    owns_session: bool
 
     oauth: OAuth2TokenResponse
     user_token: XAUResponse
-    xsts_token: XSTSResponse
+    xsts_tokens: dict[str, XSTSResponse]
 
     def __init__(
         self,
@@ -204,15 +276,30 @@ class AuthenticationManager:
         client_id: str,
         client_secret: str,
         relying_party: str,
+        token_store: typing.Optional[TokenStoreProtocol] = None,
+        *,
+        additional_relying_parties: typing.Iterable[str] = (),
+        owns_session: bool = True,
     ) -> None:
         self.session = session
         self.client_id = client_id
         self.client_secret = client_secret
         self.relying_party = relying_party
+        self.relying_parties = [relying_party]
+        self.token_store = token_store
+        # a session from a SessionFactory belongs to it, and may be shared
+        self.owns_session = owns_session
 
         self.oauth = None  # type: ignore
         self.user_token = None  # type: ignore
-        self.xsts_token = None  # type: ignore
+        self.xsts_tokens = {}
+
+        self._oauth_lock = anyio.Lock()
+        self._user_token_lock = anyio.Lock()
+        self._xsts_locks: dict[str, anyio.Lock] = {relying_party: anyio.Lock()}
+
+        for additional_relying_party in additional_relying_parties:
+            self._add_relying_party(additional_relying_party)
 
     @classmethod
     async def from_ouath(
@@ -222,8 +309,18 @@ class AuthenticationManager:
         client_secret: str,
         relying_party: str,
         oauth: OAuth2TokenResponse,
+        *,
+        additional_relying_parties: typing.Iterable[str] = (),
+        owns_session: bool = True,
     ) -> typing_ext.Self:
-        self = cls(session, client_id, client_secret, relying_party)
+        self = cls(
+            session,
+            client_id,
+            client_secret,
+            relying_party,
+            additional_relying_parties=additional_relying_parties,
+            owns_session=owns_session,
+        )
         self.oauth = oauth
         await self.refresh_tokens()
         return self
@@ -236,8 +333,18 @@ class AuthenticationManager:
         client_secret: str,
         relying_party: str,
         oauth_data: dict,
+        *,
+        additional_relying_parties: typing.Iterable[str] = (),
+        owns_session: bool = True,
     ) -> typing_ext.Self:
-        self = cls(session, client_id, client_secret, relying_party)
+        self = cls(
+            session,
+            client_id,
+            client_secret,
+            relying_party,
+            additional_relying_parties=additional_relying_parties,
+            owns_session=owns_session,
+        )
         self.oauth = OAuth2TokenResponse.from_data(oauth_data)
         await self.refresh_tokens()
         return self
@@ -250,9 +357,45 @@ class AuthenticationManager:
         client_secret: str,
         relying_party: str,
         oauth_path: str,
+        *,
+        additional_relying_parties: typing.Iterable[str] = (),
+        owns_session: bool = True,
+    ) -> typing_ext.Self:
+        return await cls.from_token_store(
+            session,
+            client_id,
+            client_secret,
+            relying_party,
+            FileTokenStore(oauth_path),
+            additional_relying_parties=additional_relying_parties,
+            owns_session=owns_session,
+        )
+
+    @classmethod
+    async def from_token_store(
+        cls,
+        session: httpx.AsyncClient,
+        client_id: str,
+        client_secret: str,
+        relying_party: str,
+        token_store: TokenStoreProtocol,
+        *,
+        additional_relying_parties: typing.Iterable[str] = (),
+        owns_session: bool = True,
     ) -> typing_ext.Self:
-        self = cls(session, client_id, client_secret, relying_party)
-        self.oauth = OAuth2TokenResponse.from_file(oauth_path)
+        self = cls(
+            session,
+            client_id,
+            client_secret,
+            relying_party,
+            token_store,
+            additional_relying_parties=additional_relying_parties,
+            owns_session=owns_session,
+        )
+        if not await self._load_stored_tokens():
+            raise ValueError("The token store has no tokens in it.")
+
+        # only tokens that are missing or expired get refreshed here
         await self.refresh_tokens()
         return self
 
@@ -285,13 +428,16 @@ class AuthenticationManager:
         if not self.oauth.refresh_token:
             raise ValueError("No refresh token present.")
 
-        return await self._oauth2_token_request(
+        oauth = await self._oauth2_token_request(
             {
                 "grant_type": "refresh_token",
                 "scope": "Xboxlive.signin Xboxlive.offline_access",
                 "refresh_token": self.oauth.refresh_token,
             },
         )
+        if not oauth.refresh_token:
+            oauth.refresh_token = self.oauth.refresh_token
+        return oauth
 
     async def request_user_token(
         self,
@@ -320,13 +466,13 @@ class AuthenticationManager:
         return await XAUResponse.from_response(resp)
 
     async def request_xsts_token(
-        self,
+        self, relying_party: typing.Optional[str] = None
     ) -> XSTSResponse:
         """Authorize via user token and receive final X token."""
         url = "https://xsts.auth.xboxlive.com/xsts/authorize"
         headers = {"x-xbl-contract-version": "1"}
         data = {
-            "RelyingParty": self.relying_party,
+            "RelyingParty": relying_party or self.relying_party,
             "TokenType": "JWT",
             "Properties": {
                 "UserTokens": [self.user_token.token],
@@ -338,22 +484,263 @@ class AuthenticationManager:
         resp.raise_for_status()
         return await XSTSResponse.from_response(resp)
 
-    async def refresh_tokens(self, force_refresh: bool = False) -> None:
-        """Refresh all tokens."""
-        if force_refresh:
-            self.oauth = await self.refresh_oauth_token()
-            self.user_token = await self.request_user_token()
-            self.xsts_token = await self.request_xsts_token()
+    @property
+    def xsts_token(self) -> XSTSResponse:
+        return self.xsts_tokens.get(self.relying_party)  # type: ignore
+
+    @xsts_token.setter
+    def xsts_token(self, value: XSTSResponse) -> None:
+        self.xsts_tokens[self.relying_party] = value
+
+    def _add_relying_party(self, relying_party: str) -> None:
+        if relying_party not in self._xsts_locks:
+            self.relying_parties.append(relying_party)
+            self._xsts_locks[relying_party] = anyio.Lock()
+
+    async def add_relying_party(self, relying_party: str) -> None:
+        """Start handling tokens for another relying party, fetching its XSTS token."""
+        self._add_relying_party(relying_party)
+        await self.refresh_tokens(relying_party=relying_party)
+
+    async def refresh_tokens(
+        self,
+        force_refresh: bool = False,
+        *,
+        margin: float = 0,
+        relying_party: typing.Optional[str] = None,
+    ) -> None:
+        """
+        Refresh all tokens.
+
+        Each token stage is guarded by its own lock, so concurrent callers wait on
+        the refresh already in flight instead of starting their own. Tokens that
+        expire within `margin` seconds are treated as expired.
+
+        If `relying_party` is given, only the XSTS token for it is refreshed.
+        Otherwise, the XSTS tokens of every relying party are refreshed concurrently.
+        """
+        if relying_party:
+            self._add_relying_party(relying_party)
+            relying_parties = (relying_party,)
         else:
-            if not (self.oauth and self.oauth.is_valid()):
-                self.oauth = await self.refresh_oauth_token()
-            if not (self.user_token and self.user_token.is_valid()):
-                self.user_token = await self.request_user_token()
-            if not (self.xsts_token and self.xsts_token.is_valid()):
-                self.xsts_token = await self.request_xsts_token()
+            relying_parties = tuple(self.relying_parties)
+
+        if not force_refresh and self._tokens_valid(margin, relying_parties):
+            return
+
+        # when forcing, only refresh tokens that are still the ones we saw when
+        # called - if they changed while waiting, someone else already forced it
+        seen_oauth = self.oauth
+        seen_user_token = self.user_token
+        seen_xsts_tokens = self.xsts_tokens.copy()
+
+        async with self._oauth_lock:
+            await self._refresh_stage(
+                lambda: self.oauth,
+                functools.partial(setattr, self, "oauth"),
+                self.refresh_oauth_token,
+                seen_oauth,
+                force_refresh,
+                margin,
+            )
+
+        async with self._user_token_lock:
+            await self._refresh_stage(
+                lambda: self.user_token,
+                functools.partial(setattr, self, "user_token"),
+                self.request_user_token,
+                seen_user_token,
+                force_refresh,
+                margin,
+            )
+
+        await self._refresh_xsts_tokens(
+            relying_parties, seen_xsts_tokens, force_refresh, margin
+        )
+
+    async def _refresh_xsts_tokens(
+        self,
+        relying_parties: tuple[str, ...],
+        seen_xsts_tokens: dict[str, XSTSResponse],
+        force_refresh: bool,
+        margin: float,
+    ) -> None:
+        def stale_relying_parties() -> list[str]:
+            return [
+                rp
+                for rp in relying_parties
+                if _should_refresh(
+                    self.xsts_tokens.get(rp),
+                    seen_xsts_tokens.get(rp),
+                    force_refresh,
+                    margin,
+                )
+            ]
+
+        async def refresh_xsts_token(relying_party: str) -> None:
+            self.xsts_tokens[relying_party] = await self.request_xsts_token(
+                relying_party
+            )
+
+        async with contextlib.AsyncExitStack() as stack:
+            # always taken in the same order, so callers can't deadlock each other
+            for rp in sorted(relying_parties):
+                await stack.enter_async_context(self._xsts_locks[rp])
+
+            if not stale_relying_parties():
+                return
+
+            stored = None
+            if self.token_store:
+                await stack.enter_async_context(self.token_store.lock())
+                stored = await self._load_stored_tokens()
+
+            if not (to_refresh := stale_relying_parties()):
+                return
+
+            if len(to_refresh) == 1:
+                await refresh_xsts_token(to_refresh[0])
+            else:
+                try:
+                    async with anyio.create_task_group() as tg:
+                        for rp in to_refresh:
+                            tg.start_soon(refresh_xsts_token, rp)
+                except ExceptionGroup as e:
+                    # raise what a single request would, not the task group's
+                    # wrapper around it
+                    raise e.exceptions[0] from None
+
+            if self.token_store:
+                await self._save_stored_tokens(stored)
+
+    async def _refresh_stage(
+        self,
+        get_token: typing.Callable[[], typing.Any],
+        set_token: typing.Callable[[typing.Any], None],
+        request_token: typing.Callable[[], typing.Awaitable[typing.Any]],
+        seen_token: typing.Any,
+        force_refresh: bool,
+        margin: float,
+    ) -> None:
+        if not _should_refresh(get_token(), seen_token, force_refresh, margin):
+            return
+
+        if not self.token_store:
+            set_token(await request_token())
+            return
+
+        async with self.token_store.lock():
+            # something else may have stored a newer token since we last looked
+            stored = await self._load_stored_tokens()
+            if _should_refresh(get_token(), seen_token, force_refresh, margin):
+                set_token(await request_token())
+                await self._save_stored_tokens(stored)
+
+    async def _load_stored_tokens(self) -> typing.Optional[StoredTokens]:
+        if not self.token_store:
+            return None
+
+        data = await self.token_store.load()
+        if not data:
+            return None
+
+        stored = StoredTokens.from_bytes(data)
+        if _is_newer(stored.oauth, self.oauth):
+            self.oauth = stored.oauth
+        if _is_newer(stored.user_token, self.user_token):
+            self.user_token = stored.user_token  # type: ignore
+        for rp in self.relying_parties:
+            if _is_newer(stored.xsts_tokens.get(rp), self.xsts_tokens.get(rp)):
+                self.xsts_tokens[rp] = stored.xsts_tokens[rp]
+        return stored
+
+    async def _save_stored_tokens(self, stored: typing.Optional[StoredTokens]) -> None:
+        if not self.token_store:
+            return
+
+        await self.token_store.save(
+            msgspec.json.encode(
+                StoredTokens(
+                    oauth=self.oauth,
+                    user_token=self.user_token,
+                    xsts_tokens=(stored.xsts_tokens if stored else {})
+                    | self.xsts_tokens,
+                )
+            )
+        )
+
+    def _tokens_valid(
+        self,
+        margin: float = 0,
+        relying_parties: typing.Optional[typing.Iterable[str]] = None,
+    ) -> bool:
+        if not (
+            self.oauth
+            and self.oauth.is_valid(margin)
+            and self.user_token
+            and self.user_token.is_valid(margin)
+        ):
+            return False
+
+        for rp in self.relying_parties if relying_parties is None else relying_parties:
+            xsts_token = self.xsts_tokens.get(rp)
+            if not (xsts_token and xsts_token.is_valid(margin)):
+                return False
+        return True
+
+    async def run_renewal(
+        self,
+        margin: float = DEFAULT_RENEWAL_MARGIN,
+        *,
+        task_status: anyio.abc.TaskStatus[None] = anyio.TASK_STATUS_IGNORED,
+    ) -> None:
+        """
+        Renew tokens until cancelled - meant to be run in a task group of your own,
+        like `tg.start_soon(auth_mgr.run_renewal)`.
+
+        Each token is refreshed `margin` seconds before it expires, so requests
+        rarely have to wait on a refresh themselves.
+        """
+        task_status.started()
+        await self._renew_tokens(margin)
+
+    @contextlib.asynccontextmanager
+    async def renewing(
+        self, margin: float = DEFAULT_RENEWAL_MARGIN
+    ) -> typing.AsyncIterator[typing_ext.Self]:
+        """Renew tokens in the background for as long as this block runs."""
+        async with anyio.create_task_group() as tg:
+            await tg.start(self.run_renewal, margin)
+            try:
+                yield self
+            finally:
+                tg.cancel_scope.cancel()
+
+    def _seconds_until_renewal(self, margin: float) -> float:
+        now = utc_now()
+        return min(
+            (token.expires_at - now).total_seconds() - margin
+            for token in (self.oauth, self.user_token, *self.xsts_tokens.values())
+            if token
+        )
+
+    async def _renew_tokens(self, margin: float) -> None:
+        while True:
+            await anyio.sleep(
+                max(self._seconds_until_renewal(margin), MIN_RENEWAL_INTERVAL)
+            )
+
+            try:
+                await self.refresh_tokens(margin=margin)
+            except anyio.get_cancelled_exc_class():
+                raise
+            except Exception as e:
+                # the request path will still refresh as needed, so just try later
+                traceback.print_exception(e)
 
     async def close(self) -> None:
-        await self.session.aclose()
+        if self.owns_session:
+            await self.session.aclose()
 
 
 class MicrosoftAPIException(Exception):
@@ -380,95 +767,228 @@ except ImportError:
         return encoder.encode(obj)
 
 
-async def should_retry(
-    auth_mgr: AuthenticationManager, response: httpx.Response
-) -> bool:
-    if not response.is_error:
-        return False
-
-    if response.status_code == 401:
-        await auth_mgr.refresh_tokens(force_refresh=True)
-        return True
+class _InFlightRequest:
+    __slots__ = ("done", "value", "exception", "cancelled")
 
-    return True
+    def __init__(self) -> None:
+        self.done = anyio.Event()
+        self.value: typing.Any = None
+        self.exception: typing.Optional[BaseException] = None
+        self.cancelled = False
 
 
 class BaseMicrosoftAPI(HandlerProtocol):
     RELYING_PATH: str = "http://xboxlive.com"
     BASE_URL: str = ""
+    HOSTS: tuple[str, ...] = ()
 
     session: httpx.AsyncClient
     auth_mgr: AuthenticationManager
+    owns_session: bool
+    response_cache: typing.Optional[ResponseCache] = None
+    coalesce_requests: bool = True
+    default_timeout: typing.Optional[float] = None
+    endpoint_timeouts: typing.Mapping[str, float] = types.MappingProxyType({})
 
     def __init__(
-        self, session: httpx.AsyncClient, auth_mgr: AuthenticationManager
+        self,
+        session: httpx.AsyncClient,
+        auth_mgr: AuthenticationManager,
+        *,
+        owns_session: bool = True,
     ) -> None:
         self.session = session
         self.auth_mgr = auth_mgr
+        self.owns_session = owns_session
+
+        self._prepared_headers: dict[tuple, dict[str, str]] = {}
+        self._prepared_headers_token: typing.Optional[XSTSResponse] = None
+        self._in_flight: dict[typing.Hashable, _InFlightRequest] = {}
+
+    @classmethod
+    def _get_session(
+        cls, session_factory: typing.Optional[SessionFactory]
+    ) -> tuple[httpx.AsyncClient, bool]:
+        # sessions from a passed-in factory are owned (and closed) by that factory
+        if session_factory:
+            return session_factory.session, False
+        return SessionFactory().session, True
 
     @classmethod
     async def from_oauth(
-        cls, client_id: str, client_secret: str, oauth: OAuth2TokenResponse
+        cls,
+        client_id: str,
+        client_secret: str,
+        oauth: OAuth2TokenResponse,
+        *,
+        additional_relying_parties: typing.Iterable[str] = (),
+        session_factory: typing.Optional[SessionFactory] = None,
     ) -> typing_ext.Self:
-        transport = retry_transport.RetryTransport(
-            wrapped_transport=httpx.AsyncHTTPTransport(http2=True, retries=2),
-            jitter_ratio=0.3,
-        )
-        session = httpx.AsyncClient(
-            transport=transport, http2=True, timeout=httpx.Timeout(5.0, read=None)
-        )
+        session, owns_session = cls._get_session(session_factory)
         auth_mgr = await AuthenticationManager.from_ouath(
-            session, client_id, client_secret, cls.RELYING_PATH, oauth
+            session,
+            client_id,
+            client_secret,
+            cls.RELYING_PATH,
+            oauth,
+            additional_relying_parties=additional_relying_parties,
+            owns_session=owns_session,
         )
-
-        session._transport._should_retry_async = functools.partial(should_retry, auth_mgr)  # type: ignore
-        return cls(session, auth_mgr)
+        return cls(session, auth_mgr, owns_session=owns_session)
 
     @classmethod
     async def from_data(
-        cls, client_id: str, client_secret: str, oauth_data: dict
+        cls,
+        client_id: str,
+        client_secret: str,
+        oauth_data: dict,
+        *,
+        additional_relying_parties: typing.Iterable[str] = (),
+        session_factory: typing.Optional[SessionFactory] = None,
     ) -> typing_ext.Self:
-        transport = retry_transport.RetryTransport(
-            wrapped_transport=httpx.AsyncHTTPTransport(http2=True, retries=2),
-            jitter_ratio=0.3,
-        )
-        session = httpx.AsyncClient(
-            transport=transport, http2=True, timeout=httpx.Timeout(5.0, read=None)
-        )
+        session, owns_session = cls._get_session(session_factory)
         auth_mgr = await AuthenticationManager.from_data(
-            session, client_id, client_secret, cls.RELYING_PATH, oauth_data
+            session,
+            client_id,
+            client_secret,
+            cls.RELYING_PATH,
+            oauth_data,
+            additional_relying_parties=additional_relying_parties,
+            owns_session=owns_session,
         )
-
-        session._transport._should_retry_async = functools.partial(should_retry, auth_mgr)  # type: ignore
-        return cls(session, auth_mgr)
+        return cls(session, auth_mgr, owns_session=owns_session)
 
     @classmethod
     async def from_file(
-        cls, client_id: str, client_secret: str, oauth_path: str = "oauth.json"
+        cls,
+        client_id: str,
+        client_secret: str,
+        oauth_path: str = "oauth.json",
+        *,
+        additional_relying_parties: typing.Iterable[str] = (),
+        session_factory: typing.Optional[SessionFactory] = None,
     ) -> typing_ext.Self:
-        transport = retry_transport.RetryTransport(
-            wrapped_transport=httpx.AsyncHTTPTransport(http2=True, retries=2),
-            jitter_ratio=0.3,
+        return await cls.from_token_store(
+            client_id,
+            client_secret,
+            FileTokenStore(oauth_path),
+            additional_relying_parties=additional_relying_parties,
+            session_factory=session_factory,
         )
-        session = httpx.AsyncClient(
-            transport=transport, http2=True, timeout=httpx.Timeout(5.0, read=None)
-        )
-        auth_mgr = await AuthenticationManager.from_file(
-            session, client_id, client_secret, cls.RELYING_PATH, oauth_path
+
+    @classmethod
+    async def from_token_store(
+        cls,
+        client_id: str,
+        client_secret: str,
+        token_store: TokenStoreProtocol,
+        *,
+        additional_relying_parties: typing.Iterable[str] = (),
+        session_factory: typing.Optional[SessionFactory] = None,
+    ) -> typing_ext.Self:
+        session, owns_session = cls._get_session(session_factory)
+        auth_mgr = await AuthenticationManager.from_token_store(
+            session,
+            client_id,
+            client_secret,
+            cls.RELYING_PATH,
+            token_store,
+            additional_relying_parties=additional_relying_parties,
+            owns_session=owns_session,
         )
+        return cls(session, auth_mgr, owns_session=owns_session)
+
+    @classmethod
+    async def from_auth_mgr(cls, auth_mgr: AuthenticationManager) -> typing_ext.Self:
+        """
+        Create this API from an existing authentication manager.
+
+        The OAuth and user tokens, as well as the HTTP session, are shared with
+        everything else using the manager - only an XSTS token for this API's
+        relying party is fetched if the manager does not already have one.
+        Neither the manager nor its session are closed when this API is.
+        """
+        await auth_mgr.add_relying_party(cls.RELYING_PATH)
+        return cls(auth_mgr.session, auth_mgr, owns_session=False)
 
-        session._transport._should_retry_async = functools.partial(should_retry, auth_mgr)  # type: ignore
-        return cls(session, auth_mgr)
+    @property
+    def xsts_token(self) -> XSTSResponse:
+        return self.auth_mgr.xsts_tokens[self.RELYING_PATH]
 
     @property
     def base_headers(self) -> dict[str, str]:
         return {
-            "Authorization": self.auth_mgr.xsts_token.authorization_header_value,
+            "Authorization": self.xsts_token.authorization_header_value,
             "Cache-Control": "no-cache, no-store",
         }
 
+    @classmethod
+    def hosts(cls) -> list[str]:
+        """Get every host this API (and the handlers it uses) makes requests to."""
+        hosts: list[str] = []
+        for klass in cls.__mro__:
+            hosts.extend(h for h in vars(klass).get("HOSTS", ()) if h not in hosts)
+        return hosts
+
+    async def warm_up(
+        self, hosts: typing.Optional[typing.Iterable[str]] = None
+    ) -> dict[str, float | Exception]:
+        """
+        Open connections to the hosts this API uses, concurrently.
+
+        Returns how long setting up each host took in seconds, or the exception that
+        occured if it couldn't be reached. Idle connections are only kept open for as
+        long as the session's keepalive expiry allows - to keep them around between
+        bursts of requests, give `SessionFactory` a longer `keepalive_expiry`.
+
+        The requests bypass retries, rate limits and the circuit breaker, and aren't
+        counted towards any of them.
+        """
+        results: dict[str, float | Exception] = {}
+
+        async def warm_up_host(host: str) -> None:
+            start = time.perf_counter()
+            try:
+                resp = await self.session.head(
+                    f"https://{host}/", extensions={"warm_up": True}
+                )
+                await resp.aclose()
+            except httpx.HTTPError as e:
+                results[host] = e
+            else:
+                results[host] = time.perf_counter() - start
+
+        async with anyio.create_task_group() as tg:
+            for host in self.hosts() if hosts is None else hosts:
+                tg.start_soon(warm_up_host, host)
+
+        return results
+
+    def _prepare_headers(
+        self, headers: typing.Optional[dict], is_json: bool
+    ) -> dict[str, str]:
+        # merged headers only change when the token does, so build them once per
+        # set of handler headers and reuse them until the token is refreshed
+        xsts_token = self.xsts_token
+        if xsts_token is not self._prepared_headers_token:
+            self._prepared_headers.clear()
+            self._prepared_headers_token = xsts_token
+
+        key = (tuple(headers.items()) if headers else (), is_json)
+        if (prepared := self._prepared_headers.get(key)) is None:
+            if len(self._prepared_headers) >= MAX_PREPARED_HEADERS:
+                self._prepared_headers.clear()
+
+            prepared = (headers or {}) | self.base_headers
+            if is_json:
+                prepared["Content-Type"] = "application/json"
+            self._prepared_headers[key] = prepared
+
+        return prepared
+
     async def close(self) -> None:
-        await self.session.aclose()
+        if self.owns_session:
+            await self.session.aclose()
 
     async def request(
         self,
@@ -482,38 +1002,83 @@ class BaseMicrosoftAPI(HandlerProtocol):
         force_refresh: bool = False,
         dont_handle_ratelimit: bool = False,
         use_url_as_is: bool = False,
+        endpoint: typing.Optional[str] = None,
+        timeout: typing.Optional[float] = None,
+        priority: typing.Optional[Priority] = None,
         **kwargs: typing.Any,
     ) -> httpx.Response:
-        if not headers:
-            headers = {}
-        if not params:
-            params = {}
+        """
+        Make a request to the API.
+
+        The request, including refreshing tokens and any retries, must finish within
+        `timeout` seconds - or, if not given, the timeout in `endpoint_timeouts` for
+        `endpoint`, or `default_timeout` - and within any enclosing `deadline`.
+        Otherwise, `DeadlineExceeded` is raised.
+
+        `priority` decides the order requests waiting on a stream or rate limit are
+        let through in. If not given, the priority set with `priority()` is used.
+        """
+        if priority is not None:
+            kwargs["extensions"] = kwargs.get("extensions", {}) | {"priority": priority}
+
+        if timeout is None:
+            timeout = self.endpoint_timeouts.get(endpoint, self.default_timeout)  # type: ignore
+
+        with deadline(timeout):
+            return await self._request(
+                method,
+                url,
+                json,
+                data,
+                params,
+                headers,
+                force_refresh=force_refresh,
+                dont_handle_ratelimit=dont_handle_ratelimit,
+                use_url_as_is=use_url_as_is,
+                **kwargs,
+            )
 
+    async def _request(
+        self,
+        method: str,
+        url: str,
+        json: typing.Any,
+        data: typing.Optional[dict],
+        params: typing.Optional[dict],
+        headers: typing.Optional[dict],
+        *,
+        force_refresh: bool,
+        dont_handle_ratelimit: bool,
+        use_url_as_is: bool,
+        **kwargs: typing.Any,
+    ) -> httpx.Response:
         # refresh token as needed
-        await self.auth_mgr.refresh_tokens(force_refresh=force_refresh)
+        await self.auth_mgr.refresh_tokens(
+            force_refresh=force_refresh, relying_party=self.RELYING_PATH
+        )
 
         if json:
             if data:
                 raise ValueError("Cannot use both json and data.")
 
             kwargs["content"] = _dumps_wrapper(json)
-            headers["Content-Type"] = "application/json"
 
         if not use_url_as_is:
             url = f"{self.BASE_URL}{url}"
 
-        req_kwargs = {
-            "method": method,
-            "url": url,
-            "headers": headers | self.base_headers,
-            "data": data,
-            "params": params,
-        } | kwargs
-
-        if dont_handle_ratelimit:
-            req_kwargs["extensions"] = {"dont_handle_ratelimit": True}
+        kwargs["extensions"] = kwargs.get("extensions", {}) | {
+            "retry_policy": self._refresh_on_unauthorized,
+            "dont_handle_ratelimit": dont_handle_ratelimit,
+        }
 
-        resp = await self.session.request(**req_kwargs)
+        resp = await self.session.request(
+            method,
+            url,
+            headers=self._prepare_headers(headers, bool(json)),
+            data=data,
+            params=params,
+            **kwargs,
+        )
 
         try:
             resp.raise_for_status()
@@ -521,6 +1086,119 @@ class BaseMicrosoftAPI(HandlerProtocol):
         except Exception as e:
             raise MicrosoftAPIException(resp, e) from e
 
+    async def _refresh_on_unauthorized(
+        self, request: httpx.Request, response: httpx.Response, attempts_made: int
+    ) -> typing.Optional[RetryDecision]:
+        # a 401 usually means the token was revoked - get a new one and retry once
+        if response.status_code != 401 or request.extensions.get("auth_refreshed"):
+            return None
+        request.extensions["auth_refreshed"] = True
+
+        # if the token changed since the request was signed, someone else has
+        # already refreshed it
+        if (
+            request.headers.get("Authorization")
+            == self.xsts_token.authorization_header_value
+        ):
+            await self.auth_mgr.refresh_tokens(
+                force_refresh=True, relying_party=self.RELYING_PATH
+            )
+
+        return RetryDecision(
+            True, 0.0, {"Authorization": self.xsts_token.authorization_header_value}
+        )
+
+    async def request_model(
+        self,
+        model: type[PB],
+        method: str,
+        url: str,
+        *,
+        endpoint: typing.Optional[str] = None,
+        **kwargs: typing.Any,
+    ) -> PB:
+        """
+        Make a request and decode its response into `model`.
+
+        `endpoint` names what is being fetched - if `response_cache` has a TTL for
+        it, GET requests are served from the cache when possible.
+
+        If `coalesce_requests` is set, concurrent identical GET requests share one
+        network call, and all of them get the same result or exception.
+
+        The timeout (see `request`) covers waiting on a shared call too.
+        """
+        timeout: typing.Optional[float] = kwargs.pop("timeout", None)
+        if timeout is None:
+            timeout = self.endpoint_timeouts.get(endpoint, self.default_timeout)  # type: ignore
+
+        async def fetch() -> PB:
+            return await model.from_response(
+                await self.request(
+                    method, url, endpoint=endpoint, timeout=timeout, **kwargs
+                )
+            )
+
+        with deadline(timeout):
+            if method != "GET":
+                return await fetch()
+
+            key = self._request_key(method, url, kwargs)
+
+            if self.coalesce_requests:
+                fetch = functools.partial(self._coalesce, key, fetch)
+
+            if not (self.response_cache and self.response_cache.caches(endpoint)):
+                return await fetch()
+
+            return await self.response_cache.get_or_fetch(
+                endpoint, key, fetch  # type: ignore
+            )
+
+    async def _coalesce(
+        self, key: typing.Hashable, fetch: typing.Callable[[], typing.Awaitable[PB]]
+    ) -> PB:
+        while flight := self._in_flight.get(key):
+            await flight.done.wait()
+
+            if flight.exception is not None:
+                raise flight.exception
+            if not flight.cancelled:
+                return flight.value
+            # the request was cancelled by whoever made it, or ran out of their
+            # time - try again ourselves
+
+        flight = _InFlightRequest()
+        self._in_flight[key] = flight
+
+        try:
+            flight.value = await fetch()
+            return flight.value
+        except (anyio.get_cancelled_exc_class(), DeadlineExceeded):
+            flight.cancelled = True
+            raise
+        except Exception as e:
+            flight.exception = e
+            raise
+        finally:
+            del self._in_flight[key]
+            flight.done.set()
+
+    def _request_key(
+        self, method: str, url: str, kwargs: dict[str, typing.Any]
+    ) -> typing.Hashable:
+        if not kwargs.get("use_url_as_is"):
+            url = f"{self.BASE_URL}{url}"
+
+        params = kwargs.get("params")
+        headers = kwargs.get("headers")
+        return (
+            method,
+            url,
+            tuple(sorted(params.items())) if params else (),
+            tuple(sorted(headers.items())) if headers else (),
+        )
+
     async def get(
         self,
         url: str,
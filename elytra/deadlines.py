@@ -0,0 +1,83 @@
+"""
+MIT License
+
+Copyright (c) 2023-2024 AstreaTSS
+
+Permission is hereby granted, free of charge, to any person obtaining a copy
+of this software and associated documentation files (the "Software"), to deal
+in the Software without restriction, including without limitation the rights
+to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+copies of the Software, and to permit persons to whom the Software is
+furnished to do so, subject to the following conditions:
+
+The above copyright notice and this permission notice shall be included in all
+copies or substantial portions of the Software.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+SOFTWARE.
+"""
+
+import contextlib
+import contextvars
+import time
+import typing
+
+import anyio
+
+__all__ = ("DeadlineExceeded", "deadline", "current_deadline", "time_remaining")
+
+_deadline: contextvars.ContextVar[typing.Optional[float]] = contextvars.ContextVar(
+    "elytra_deadline", default=None
+)
+
+
+class DeadlineExceeded(TimeoutError):
+    """Raised when an operation doesn't finish before its deadline."""
+
+
+def current_deadline() -> typing.Optional[float]:
+    """Get the current deadline, in `time.monotonic` time, if there is one."""
+    return _deadline.get()
+
+
+def time_remaining() -> typing.Optional[float]:
+    """Get how many seconds are left until the current deadline, if there is one."""
+    if (current := _deadline.get()) is None:
+        return None
+    return max(current - time.monotonic(), 0.0)
+
+
+@contextlib.contextmanager
+def deadline(timeout: typing.Optional[float]) -> typing.Iterator[None]:
+    """
+    Give everything in this block `timeout` seconds to finish, raising
+    `DeadlineExceeded` if it doesn't.
+
+    Deadlines nest - a block never gets longer than an enclosing one allows - and
+    are seen by every request made inside the block, including the retries of the
+    transport, which aren't attempted if they can't finish in time. A `timeout` of
+    `None` just keeps the enclosing deadline, if any.
+    """
+    now = time.monotonic()
+    current = _deadline.get()
+    if timeout is not None and (current is None or now + timeout < current):
+        current = now + timeout
+
+    if current is None:
+        yield
+        return
+
+    token = _deadline.set(current)
+    try:
+        with anyio.move_on_after(current - now) as scope:
+            yield
+    finally:
+        _deadline.reset(token)
+
+    if scope.cancelled_caught:
+        raise DeadlineExceeded("The deadline was exceeded.")
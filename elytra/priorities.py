@@ -0,0 +1,174 @@
+"""
+MIT License
+
+Copyright (c) 2023-2024 AstreaTSS
+
+Permission is hereby granted, free of charge, to any person obtaining a copy
+of this software and associated documentation files (the "Software"), to deal
+in the Software without restriction, including without limitation the rights
+to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+copies of the Software, and to permit persons to whom the Software is
+furnished to do so, subject to the following conditions:
+
+The above copyright notice and this permission notice shall be included in all
+copies or substantial portions of the Software.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+SOFTWARE.
+"""
+
+import contextlib
+import contextvars
+import time
+import typing
+from collections import deque
+from enum import IntEnum
+
+import anyio
+import anyio.lowlevel
+import httpx
+
+__all__ = (
+    "Priority",
+    "PrioritySemaphore",
+    "priority",
+    "current_priority",
+    "request_priority",
+)
+
+
+class Priority(IntEnum):
+    INTERACTIVE = 0
+    NORMAL = 1
+    BACKGROUND = 2
+
+
+_priority: contextvars.ContextVar[Priority] = contextvars.ContextVar(
+    "elytra_priority", default=Priority.NORMAL
+)
+
+
+def current_priority() -> Priority:
+    """Get the priority requests made right now are sent with."""
+    return _priority.get()
+
+
+@contextlib.contextmanager
+def priority(value: Priority) -> typing.Iterator[None]:
+    """Send every request made inside this block with the given priority."""
+    token = _priority.set(value)
+    try:
+        yield
+    finally:
+        _priority.reset(token)
+
+
+def request_priority(request: httpx.Request) -> Priority:
+    """
+    Get the priority of a request - the one in its "priority" extension if set, or
+    else the one it was made under.
+    """
+    value = request.extensions.get("priority")
+    return Priority(value) if value is not None else _priority.get()
+
+
+class _Waiter:
+    __slots__ = ("event", "enqueued_at", "granted")
+
+    def __init__(self) -> None:
+        self.event = anyio.Event()
+        self.enqueued_at = time.monotonic()
+        self.granted = False
+
+
+class PrioritySemaphore:
+    """
+    A semaphore that lets waiters in by priority, and first in, first out within
+    the same priority.
+
+    So that lower priorities are never starved, a share of the slots is kept for
+    them: once higher priorities have been let in ahead of waiting lower ones enough
+    times in a row, the longest-waiting lower priority waiter goes next. However
+    backed up things get, higher priorities keep the rest of the slots.
+
+    Args:
+        value: How many holders are allowed at once.
+        lower_share: The share of slots kept for lower priorities while higher \
+            ones are waiting too.
+    """
+
+    __slots__ = ("value", "lower_share", "_waiters", "_passed_over")
+
+    def __init__(self, value: int, *, lower_share: float = 0.2) -> None:
+        if not 0 < lower_share <= 1:
+            raise ValueError("lower_share must be above 0, and at most 1.")
+
+        self.value = value
+        self.lower_share = lower_share
+        self._waiters: dict[Priority, deque[_Waiter]] = {p: deque() for p in Priority}
+        # how many times in a row lower priority waiters have been passed over
+        self._passed_over = 0
+
+    @property
+    def waiting(self) -> int:
+        return sum(len(waiters) for waiters in self._waiters.values())
+
+    async def acquire(self, priority: Priority = Priority.NORMAL) -> None:
+        await anyio.lowlevel.checkpoint_if_cancelled()
+        if self.value > 0 and not self.waiting:
+            self.value -= 1
+            # the slot is taken by now, so being cancelled here would lose it
+            await anyio.lowlevel.cancel_shielded_checkpoint()
+            return
+
+        waiter = _Waiter()
+        self._waiters[priority].append(waiter)
+
+        try:
+            await waiter.event.wait()
+        except BaseException:
+            if waiter.granted:
+                # we were let in just as we were cancelled - let the next one in
+                self.release()
+            else:
+                self._waiters[priority].remove(waiter)
+            raise
+
+    def _next_waiter(self) -> typing.Optional[_Waiter]:
+        # the queues are ordered by priority
+        queues = [waiters for waiters in self._waiters.values() if waiters]
+        if not queues:
+            return None
+
+        if len(queues) == 1:
+            self._passed_over = 0
+            return queues[0].popleft()
+
+        if self._passed_over + 1 >= 1 / self.lower_share:
+            self._passed_over = 0
+            return min(queues[1:], key=lambda w: w[0].enqueued_at).popleft()
+
+        self._passed_over += 1
+        return queues[0].popleft()
+
+    def release(self) -> None:
+        if waiter := self._next_waiter():
+            waiter.granted = True
+            waiter.event.set()
+        else:
+            self.value += 1
+
+    @contextlib.asynccontextmanager
+    async def hold(
+        self, priority: Priority = Priority.NORMAL
+    ) -> typing.AsyncIterator[None]:
+        await self.acquire(priority)
+        try:
+            yield
+        finally:
+            self.release()
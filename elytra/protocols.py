@@ -26,6 +26,8 @@ import typing
 
 import httpx
 
+T = typing.TypeVar("T")
+
 
 class HandlerProtocol(typing.Protocol):
     async def request(
@@ -38,9 +40,22 @@ class HandlerProtocol(typing.Protocol):
         headers: typing.Optional[dict] = None,
         *,
         force_refresh: bool = False,
+        endpoint: typing.Optional[str] = None,
+        timeout: typing.Optional[float] = None,
+        priority: typing.Optional[int] = None,
         **kwargs: typing.Any,
     ) -> httpx.Response: ...
 
+    async def request_model(
+        self,
+        model: type[T],
+        method: str,
+        url: str,
+        *,
+        endpoint: typing.Optional[str] = None,
+        **kwargs: typing.Any,
+    ) -> T: ...
+
     async def get(
         self,
         url: str,
@@ -80,3 +95,11 @@ class HandlerProtocol(typing.Protocol):
         headers: typing.Optional[dict] = None,
         **kwargs: typing.Any,
     ) -> httpx.Response: ...
+
+
+class TokenStoreProtocol(typing.Protocol):
+    async def load(self) -> typing.Optional[bytes]: ...
+
+    async def save(self, data: bytes) -> None: ...
+
+    def lock(self) -> typing.AsyncContextManager[None]: ...
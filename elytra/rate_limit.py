@@ -0,0 +1,234 @@
+"""
+MIT License
+
+Copyright (c) 2023-2024 AstreaTSS
+
+Permission is hereby granted, free of charge, to any person obtaining a copy
+of this software and associated documentation files (the "Software"), to deal
+in the Software without restriction, including without limitation the rights
+to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+copies of the Software, and to permit persons to whom the Software is
+furnished to do so, subject to the following conditions:
+
+The above copyright notice and this permission notice shall be included in all
+copies or substantial portions of the Software.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+SOFTWARE.
+"""
+
+import time
+import typing
+
+import anyio
+import httpx
+import msgspec
+
+from elytra.priorities import Priority, PrioritySemaphore, request_priority
+
+__all__ = ("RateLimit", "RateLimitBudget", "RateLimitTransport", "HOST_FAMILIES")
+
+HOST_FAMILIES: dict[str, str] = {
+    "profile.xboxlive.com": "profile",
+    "peoplehub.xboxlive.com": "peoplehub",
+    "clubhub.xboxlive.com": "clubhub",
+    "social.xboxlive.com": "social",
+    "xblmessaging.xboxlive.com": "xblmessaging",
+    "pocket.realms.minecraft.net": "realms",
+    "frontend.realms.minecraft-services.net": "realms",
+}
+
+
+class RateLimit(msgspec.Struct, frozen=True):
+    """Allows `requests` requests every `per` seconds, in bursts of up to `requests`."""
+
+    requests: int
+    per: float
+
+
+class RateLimitBudget(msgspec.Struct, kw_only=True):
+    family: str
+    capacity: float
+    tokens: float
+    refill_rate: float
+    queued: int = 0
+    resets_in: typing.Optional[float] = None
+
+
+def _parse_header_number(value: typing.Optional[str]) -> typing.Optional[float]:
+    # handles both plain numbers and the "10, 10;w=15" style of the IETF draft
+    if value is None:
+        return None
+    try:
+        return float(value.split(",", 1)[0].split(";", 1)[0].strip())
+    except ValueError:
+        return None
+
+
+class _TokenBucket:
+    __slots__ = (
+        "capacity",
+        "refill_rate",
+        "tokens",
+        "updated_at",
+        "reset_at",
+        "queued",
+        "gate",
+    )
+
+    def __init__(self, capacity: float, refill_rate: float) -> None:
+        self.capacity = capacity
+        self.refill_rate = refill_rate
+        self.tokens = capacity
+        self.updated_at = time.monotonic()
+        self.reset_at: typing.Optional[float] = None
+        self.queued = 0
+        # waiting requests go out by priority, then first in, first out
+        self.gate = PrioritySemaphore(1)
+
+    def _refill(self, now: float) -> None:
+        if self.refill_rate:
+            self.tokens = min(
+                self.capacity,
+                self.tokens + (now - self.updated_at) * self.refill_rate,
+            )
+        self.updated_at = now
+
+        if self.reset_at is not None and now >= self.reset_at:
+            self.tokens = self.capacity
+            self.reset_at = None
+
+    def _time_until_token(self, now: float) -> float:
+        waits = []
+        if self.refill_rate:
+            waits.append((1 - self.tokens) / self.refill_rate)
+        if self.reset_at is not None:
+            waits.append(self.reset_at - now)
+        return max(min(waits, default=0.0), 0.0)
+
+    async def acquire(self, priority: Priority) -> None:
+        self.queued += 1
+        try:
+            async with self.gate.hold(priority):
+                while True:
+                    now = time.monotonic()
+                    self._refill(now)
+
+                    if self.tokens >= 1 or not (
+                        self.refill_rate or self.reset_at is not None
+                    ):
+                        self.tokens -= 1
+                        return
+
+                    await anyio.sleep(self._time_until_token(now))
+        finally:
+            self.queued -= 1
+
+    def learn(
+        self,
+        limit: typing.Optional[float],
+        remaining: typing.Optional[float],
+        reset: typing.Optional[float],
+    ) -> None:
+        now = time.monotonic()
+        self._refill(now)
+
+        if limit is not None and limit > 0:
+            self.capacity = limit
+        if remaining is not None:
+            self.tokens = min(self.tokens, remaining)
+        if reset is not None:
+            # large values are unix timestamps, small ones are seconds from now
+            if reset > 1e9:
+                reset -= time.time()
+            self.reset_at = now + max(reset, 0.0)
+
+    def budget(self, family: str) -> RateLimitBudget:
+        now = time.monotonic()
+        self._refill(now)
+        return RateLimitBudget(
+            family=family,
+            capacity=self.capacity,
+            tokens=max(self.tokens, 0.0),
+            refill_rate=self.refill_rate,
+            queued=self.queued,
+            resets_in=self.reset_at - now if self.reset_at is not None else None,
+        )
+
+
+class RateLimitTransport(httpx.AsyncBaseTransport):
+    """
+    Wraps a transport, holding requests back so that they stay within a budget of
+    requests per endpoint family.
+
+    Each family gets a token bucket. Requests take a token before they are sent, and
+    wait in line for one if none are left - in order of priority (see `Priority`),
+    then first in, first out. Hosts map to families through
+    `HOST_FAMILIES` - other hosts are their own family.
+
+    Budgets are also learned from the `X-RateLimit-Limit`, `X-RateLimit-Remaining`
+    and `X-RateLimit-Reset` response headers: a family the server reports as spent
+    is held back until its reported reset, even if it had no configured budget.
+
+    Args:
+        wrapped_transport: The transport to send requests with.
+        rate_limits: The budget for each family, keyed by family name.
+    """
+
+    def __init__(
+        self,
+        wrapped_transport: httpx.AsyncBaseTransport,
+        rate_limits: typing.Optional[typing.Mapping[str, RateLimit]] = None,
+    ) -> None:
+        self._wrapped_transport = wrapped_transport
+        self._buckets: dict[str, _TokenBucket] = {
+            family: _TokenBucket(float(limit.requests), limit.requests / limit.per)
+            for family, limit in (rate_limits or {}).items()
+        }
+
+    @staticmethod
+    def family_of(host: str) -> str:
+        return HOST_FAMILIES.get(host, host)
+
+    async def handle_async_request(self, request: httpx.Request) -> httpx.Response:
+        # connection warm-ups don't spend or learn from a budget
+        if request.extensions.get("warm_up"):
+            return await self._wrapped_transport.handle_async_request(request)
+
+        family = self.family_of(request.url.host)
+
+        if bucket := self._buckets.get(family):
+            await bucket.acquire(request_priority(request))
+
+        response = await self._wrapped_transport.handle_async_request(request)
+        self._learn(family, response.headers)
+        return response
+
+    def _learn(self, family: str, headers: httpx.Headers) -> None:
+        limit = _parse_header_number(headers.get("x-ratelimit-limit"))
+        remaining = _parse_header_number(headers.get("x-ratelimit-remaining"))
+        reset = _parse_header_number(headers.get("x-ratelimit-reset"))
+
+        if limit is None and remaining is None:
+            return
+
+        if (bucket := self._buckets.get(family)) is None:
+            if limit is None:
+                return
+            bucket = self._buckets[family] = _TokenBucket(limit, 0.0)
+
+        bucket.learn(limit, remaining, reset)
+
+    def budgets(self) -> dict[str, RateLimitBudget]:
+        """Get the current budget of every family that has one."""
+        return {
+            family: bucket.budget(family) for family, bucket in self._buckets.items()
+        }
+
+    async def aclose(self) -> None:
+        await self._wrapped_transport.aclose()
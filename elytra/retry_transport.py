@@ -25,16 +25,386 @@ SOFTWARE.
 import contextlib
 import random
 import time
-from collections.abc import Callable, Coroutine, Iterable, Mapping
+from collections import deque
+from collections.abc import Awaitable, Callable, Coroutine, Iterable, Mapping
 from datetime import datetime
+from enum import Enum
 from functools import partial
 from http import HTTPStatus
-from typing import Any, Union
+from typing import Any, NamedTuple, Optional, Union
 
 import anyio
 import httpx
 from dateutil.parser import isoparse
 
+from elytra.deadlines import time_remaining
+
+__all__ = (
+    "RetryTransport",
+    "RetryDecision",
+    "RetryPolicy",
+    "RetryBudget",
+    "RequestHedger",
+    "CircuitBreaker",
+    "CircuitOpenError",
+    "CircuitState",
+    "CircuitStats",
+)
+
+
+class RetryDecision(NamedTuple):
+    """
+    What a retry policy decided to do about a response.
+
+    Attributes:
+        retry (bool): Whether to retry the request.
+        wait (float | None): How long to wait before retrying, in seconds. If None, the usual backoff is used.
+        headers (Mapping[str, str] | None): Headers to replace on the request before retrying it, like a
+            fresh Authorization header.
+    """
+
+    retry: bool
+    wait: Optional[float] = None
+    headers: Optional[Mapping[str, str]] = None
+
+
+RetryPolicy = Callable[
+    [httpx.Request, httpx.Response, int], Awaitable[Optional[RetryDecision]]
+]
+
+FAILURE_STATUS_CODES = frozenset(
+    [
+        HTTPStatus.INTERNAL_SERVER_ERROR,
+        HTTPStatus.BAD_GATEWAY,
+        HTTPStatus.SERVICE_UNAVAILABLE,
+        HTTPStatus.GATEWAY_TIMEOUT,
+    ]
+)
+
+
+class CircuitOpenError(httpx.TransportError):
+    """Raised instead of sending a request to a host whose circuit breaker is open."""
+
+    def __init__(self, host: str, retry_in: float) -> None:
+        self.host = host
+        self.retry_in = retry_in
+        super().__init__(
+            f"The circuit breaker for {host} is open, retry in {retry_in:.1f} seconds."
+        )
+
+
+class CircuitState(Enum):
+    CLOSED = "CLOSED"
+    OPEN = "OPEN"
+    HALF_OPEN = "HALF_OPEN"
+
+
+class CircuitStats(NamedTuple):
+    host: str
+    state: CircuitState
+    requests: int
+    failures: int
+    retry_in: Optional[float]
+
+
+class _Circuit:
+    __slots__ = ("state", "outcomes", "opened_at", "probes")
+
+    def __init__(self) -> None:
+        self.state = CircuitState.CLOSED
+        self.outcomes: deque[tuple[float, bool]] = deque()
+        self.opened_at = 0.0
+        self.probes = 0
+
+
+class CircuitBreaker:
+    """
+    Stops sending requests to hosts that keep failing.
+
+    Each host's breaker starts closed. If, within the last `window` seconds, at least
+    `min_requests` requests were made to it and at least `failure_threshold` of them
+    failed (with a transport error or a 5xx status), it opens: requests to the host
+    raise CircuitOpenError straight away. After `open_duration` seconds it becomes
+    half-open and lets up to `half_open_max_calls` requests through - if they
+    succeed it closes again, otherwise it reopens.
+
+    Args:
+        failure_threshold (float, optional): The ratio of failed requests that opens the breaker. Defaults to 0.5.
+        min_requests (int, optional): How many requests must be made in the window before the breaker can
+            open. Defaults to 10.
+        window (float, optional): How far back requests are considered, in seconds. Defaults to 30.
+        open_duration (float, optional): How long the breaker stays open, in seconds. Defaults to 30.
+        half_open_max_calls (int, optional): How many requests may be in flight while half-open. Defaults to 1.
+    """
+
+    def __init__(
+        self,
+        failure_threshold: float = 0.5,
+        min_requests: int = 10,
+        window: float = 30.0,
+        open_duration: float = 30.0,
+        half_open_max_calls: int = 1,
+    ) -> None:
+        self.failure_threshold = failure_threshold
+        self.min_requests = min_requests
+        self.window = window
+        self.open_duration = open_duration
+        self.half_open_max_calls = half_open_max_calls
+        self._circuits: dict[str, _Circuit] = {}
+
+    def _circuit(self, host: str) -> _Circuit:
+        if (circuit := self._circuits.get(host)) is None:
+            circuit = self._circuits[host] = _Circuit()
+        return circuit
+
+    def _trim(self, circuit: _Circuit, now: float) -> None:
+        while circuit.outcomes and circuit.outcomes[0][0] < now - self.window:
+            circuit.outcomes.popleft()
+
+    def before_request(self, host: str) -> None:
+        """Raise CircuitOpenError if a request to `host` shouldn't be sent right now."""
+        circuit = self._circuit(host)
+        now = time.monotonic()
+
+        if circuit.state is CircuitState.OPEN:
+            retry_in = circuit.opened_at + self.open_duration - now
+            if retry_in > 0:
+                raise CircuitOpenError(host, retry_in)
+            circuit.state = CircuitState.HALF_OPEN
+            circuit.probes = 0
+
+        if circuit.state is CircuitState.HALF_OPEN:
+            if circuit.probes >= self.half_open_max_calls:
+                raise CircuitOpenError(host, 0.0)
+            circuit.probes += 1
+
+    def record(self, host: str, failed: Optional[bool]) -> None:
+        """
+        Record how a request to `host` went. `None` means it finished without an
+        outcome, like when it was cancelled.
+        """
+        circuit = self._circuit(host)
+        now = time.monotonic()
+
+        if circuit.state is CircuitState.HALF_OPEN:
+            circuit.probes = max(circuit.probes - 1, 0)
+            if failed is None:
+                return
+
+            if failed:
+                circuit.state = CircuitState.OPEN
+                circuit.opened_at = now
+            else:
+                circuit.state = CircuitState.CLOSED
+                circuit.outcomes.clear()
+            return
+
+        if failed is None or circuit.state is CircuitState.OPEN:
+            return
+
+        circuit.outcomes.append((now, failed))
+        self._trim(circuit, now)
+
+        failures = sum(1 for _, f in circuit.outcomes if f)
+        if (
+            len(circuit.outcomes) >= self.min_requests
+            and failures / len(circuit.outcomes) >= self.failure_threshold
+        ):
+            circuit.state = CircuitState.OPEN
+            circuit.opened_at = now
+
+    def states(self) -> dict[str, CircuitStats]:
+        """Get the state of every host's breaker."""
+        now = time.monotonic()
+        stats = {}
+
+        for host, circuit in self._circuits.items():
+            self._trim(circuit, now)
+            retry_in = (
+                max(circuit.opened_at + self.open_duration - now, 0.0)
+                if circuit.state is CircuitState.OPEN
+                else None
+            )
+            stats[host] = CircuitStats(
+                host,
+                circuit.state,
+                len(circuit.outcomes),
+                sum(1 for _, f in circuit.outcomes if f),
+                retry_in,
+            )
+
+        return stats
+
+
+class RetryBudget:
+    """
+    Caps retries at a ratio of recent requests, so that an outage doesn't multiply
+    the load on a struggling service.
+
+    Args:
+        ratio (float, optional): How many retries are allowed per request made in the window. Defaults to 0.2.
+        min_retries (int, optional): How many retries are always allowed in the window, so that quiet
+            periods can still retry. Defaults to 10.
+        window (float, optional): How far back requests and retries are counted, in seconds. Defaults to 10.
+    """
+
+    def __init__(
+        self, ratio: float = 0.2, min_retries: int = 10, window: float = 10.0
+    ) -> None:
+        self.ratio = ratio
+        self.min_retries = min_retries
+        self.window = window
+        self._requests: deque[float] = deque()
+        self._retries: deque[float] = deque()
+
+    def _trim(self, now: float) -> None:
+        for events in (self._requests, self._retries):
+            while events and events[0] < now - self.window:
+                events.popleft()
+
+    def record_request(self) -> None:
+        self._requests.append(time.monotonic())
+
+    def try_spend(self) -> bool:
+        """Use up a retry if there are any left, returning whether there were."""
+        now = time.monotonic()
+        self._trim(now)
+
+        if len(self._retries) >= max(
+            self.min_retries, self.ratio * len(self._requests)
+        ):
+            return False
+
+        self._retries.append(now)
+        return True
+
+    def stats(self) -> dict[str, int]:
+        self._trim(time.monotonic())
+        return {"requests": len(self._requests), "retries": len(self._retries)}
+
+
+class RequestHedger:
+    """
+    Sends a second copy of slow requests, using whichever response arrives first.
+
+    A request is hedged once it has gone without a response for longer than the
+    `percentile` latency of recent requests to its host, clamped between `min_delay`
+    and `max_delay`. Until `min_samples` latencies have been seen for a host, its
+    requests aren't hedged. The losing copy is cancelled.
+
+    Only `methods` are hedged, as they are safe to send twice - requests can also
+    opt in or out with the "hedge" request extension. Hedges are taken from their own
+    budget, capped at `budget_ratio` of recent requests, so that they can't double
+    the load.
+
+    Args:
+        percentile (float, optional): Which latency percentile to wait for before hedging. Defaults to 0.95.
+        min_delay (float, optional): The least time to wait before hedging, in seconds. Defaults to 0.05.
+        max_delay (float, optional): The most time to wait before hedging, in seconds. Defaults to 2.
+        min_samples (int, optional): How many latencies must be known for a host before hedging. Defaults to 20.
+        window_size (int, optional): How many recent latencies are kept for each host. Defaults to 200.
+        budget_ratio (float, optional): How many hedges are allowed per request made recently. Defaults to 0.1.
+        methods (Iterable[str], optional): The HTTP methods to hedge. Defaults to ["GET", "HEAD"].
+    """
+
+    def __init__(
+        self,
+        percentile: float = 0.95,
+        min_delay: float = 0.05,
+        max_delay: float = 2.0,
+        min_samples: int = 20,
+        window_size: int = 200,
+        budget_ratio: float = 0.1,
+        methods: Iterable[str] = ("GET", "HEAD"),
+    ) -> None:
+        self.percentile = percentile
+        self.min_delay = min_delay
+        self.max_delay = max_delay
+        self.min_samples = min_samples
+        self.window_size = window_size
+        self.methods = frozenset(methods)
+        self.budget = RetryBudget(ratio=budget_ratio, min_retries=0)
+        self.hedges_sent = 0
+        self.hedges_won = 0
+        self._latencies: dict[str, deque[float]] = {}
+
+    def should_hedge(self, request: httpx.Request) -> bool:
+        hedge = request.extensions.get("hedge")
+        return request.method in self.methods if hedge is None else hedge
+
+    def delay(self, host: str) -> Optional[float]:
+        """How long to wait before hedging a request to `host`, or None to not hedge."""
+        latencies = self._latencies.get(host)
+        if not latencies or len(latencies) < self.min_samples:
+            return None
+
+        ordered = sorted(latencies)
+        latency = ordered[int(self.percentile * (len(ordered) - 1))]
+        return min(max(latency, self.min_delay), self.max_delay)
+
+    def record_latency(self, host: str, latency: float) -> None:
+        if (latencies := self._latencies.get(host)) is None:
+            latencies = self._latencies[host] = deque(maxlen=self.window_size)
+        latencies.append(latency)
+
+    async def send(
+        self,
+        request: httpx.Request,
+        send_method: Callable[..., Coroutine[Any, Any, httpx.Response]],
+    ) -> httpx.Response:
+        host = request.url.host
+        delay = self.delay(host)
+        self.budget.record_request()
+
+        if delay is None:
+            start = time.monotonic()
+            response = await send_method(request)
+            self.record_latency(host, time.monotonic() - start)
+            return response
+
+        responses: list[httpx.Response] = []
+        errors: list[Exception] = []
+        hedge_sent = False
+
+        async def attempt(is_hedge: bool, scope: anyio.CancelScope) -> None:
+            nonlocal hedge_sent
+
+            if is_hedge:
+                await anyio.sleep(delay)
+                if not self.budget.try_spend():
+                    return
+                hedge_sent = True
+                self.hedges_sent += 1
+
+            start = time.monotonic()
+            try:
+                response = await send_method(request)
+            except Exception as e:
+                errors.append(e)
+                # without a hedge in flight, there is nothing left to wait for
+                if not hedge_sent:
+                    scope.cancel()
+                return
+
+            if responses:
+                with anyio.CancelScope(shield=True):
+                    await response.aclose()
+                return
+
+            responses.append(response)
+            self.record_latency(host, time.monotonic() - start)
+            if is_hedge:
+                self.hedges_won += 1
+            scope.cancel()
+
+        async with anyio.create_task_group() as tg:
+            tg.start_soon(attempt, False, tg.cancel_scope)
+            tg.start_soon(attempt, True, tg.cancel_scope)
+
+        if responses:
+            return responses[0]
+        raise errors[0]
+
 
 # Adapted from https://github.com/encode/httpx/issues/108#issuecomment-1434439481
 class RetryTransport(httpx.AsyncBaseTransport, httpx.BaseTransport):
@@ -58,6 +428,19 @@ class RetryTransport(httpx.AsyncBaseTransport, httpx.BaseTransport):
             ["HEAD", "GET", "PUT", "POST", "DELETE", "OPTIONS", "TRACE"].
         retry_status_codes (Iterable[int], optional): The HTTP status codes that can be retried. Defaults to
             [429, 502, 503, 504].
+        retry_policy (RetryPolicy, optional): An async callable that is given the request, the response and
+            the number of attempts made so far, and returns a RetryDecision - or None to fall back to
+            `retry_status_codes`. A policy set in the "retry_policy" request extension is asked first.
+            Policies are only used for async requests.
+        circuit_breaker (CircuitBreaker, optional): If given, requests to hosts that keep failing raise
+            CircuitOpenError instead of being sent.
+        retry_budget (RetryBudget, optional): If given, caps how many retries may be made across all
+            requests, relative to how many requests are made.
+        hedger (RequestHedger, optional): If given, slow requests get a second copy sent, and the first
+            response is used. Only used for async requests.
+
+    Requests with the "warm_up" extension set are sent once as-is, and aren't counted by the circuit
+    breaker, retry budget or hedger.
 
     Attributes:
         _wrapped_transport (Union[httpx.BaseTransport, httpx.AsyncBaseTransport]): The underlying HTTP transport
@@ -69,6 +452,12 @@ class RetryTransport(httpx.AsyncBaseTransport, httpx.BaseTransport):
         _retry_status_codes (frozenset): The HTTP status codes that can be retried.
         _jitter_ratio (float): The amount of jitter to add to the backoff time.
         _max_backoff_wait (float): The maximum time to wait between retries in seconds.
+        _retry_policy (RetryPolicy | None): The policy deciding whether to retry a response.
+        _circuit_breaker (CircuitBreaker | None): The circuit breaker for each host, if any.
+        _retry_budget (RetryBudget | None): The budget retries are taken from, if any.
+        _hedger (RequestHedger | None): What hedges slow requests, if anything.
+        _cooldowns (dict[str, tuple[float, float]]): For each host that has sent back a 429, when requests
+            to it may resume (in monotonic time) and how long the cooldown was.
 
     """
 
@@ -96,6 +485,10 @@ class RetryTransport(httpx.AsyncBaseTransport, httpx.BaseTransport):
         retryable_methods: Iterable[str] | None = None,
         retry_status_codes: Iterable[int] | None = None,
         logger: Any | None = None,
+        retry_policy: RetryPolicy | None = None,
+        circuit_breaker: CircuitBreaker | None = None,
+        retry_budget: RetryBudget | None = None,
+        hedger: RequestHedger | None = None,
     ) -> None:
         """
         Initializes the instance of RetryTransport class with the given parameters.
@@ -125,6 +518,15 @@ class RetryTransport(httpx.AsyncBaseTransport, httpx.BaseTransport):
                 The HTTP status codes that can be retried.
                 Defaults to [429, 502, 503, 504].
             logger (Any): The logger to use for logging retries.
+            retry_policy (RetryPolicy, optional):
+                An async callable deciding whether to retry a response, how long to wait, and which
+                headers to replace before retrying. Returning None falls back to `retry_status_codes`.
+            circuit_breaker (CircuitBreaker, optional):
+                The circuit breaker to check before sending each request, and to record its outcome in.
+            retry_budget (RetryBudget, optional):
+                The budget to take retries from. Once it runs out, failed requests aren't retried.
+            hedger (RequestHedger, optional):
+                What sends a second copy of slow requests.
         """
         self._wrapped_transport = wrapped_transport
         if jitter_ratio < 0 or jitter_ratio > 0.5:
@@ -148,6 +550,11 @@ class RetryTransport(httpx.AsyncBaseTransport, httpx.BaseTransport):
         self._jitter_ratio = jitter_ratio
         self._max_backoff_wait = max_backoff_wait
         self._logger = logger
+        self._retry_policy = retry_policy
+        self._circuit_breaker = circuit_breaker
+        self._retry_budget = retry_budget
+        self._hedger = hedger
+        self._cooldowns: dict[str, tuple[float, float]] = {}
 
     def handle_request(self, request: httpx.Request) -> httpx.Response:
         """
@@ -178,10 +585,12 @@ class RetryTransport(httpx.AsyncBaseTransport, httpx.BaseTransport):
 
         """
         transport: httpx.AsyncBaseTransport = self._wrapped_transport  # type: ignore
-        if not self._is_retryable_method(request):
+        if not self._is_retryable_method(request) or request.extensions.get("warm_up"):
             return await transport.handle_async_request(request)
 
         send_method = partial(transport.handle_async_request)
+        if self._hedger and self._hedger.should_hedge(request):
+            send_method = partial(self._hedger.send, send_method=send_method)
         return await self._retry_operation_async(request, send_method)
 
     async def aclose(self) -> None:
@@ -210,6 +619,56 @@ class RetryTransport(httpx.AsyncBaseTransport, httpx.BaseTransport):
     def _should_retry(self, response: httpx.Response) -> bool:
         return response.status_code in self._retry_status_codes
 
+    async def _decide_retry(
+        self, request: httpx.Request, response: httpx.Response, attempts_made: int
+    ) -> RetryDecision:
+        for policy in (request.extensions.get("retry_policy"), self._retry_policy):
+            if policy and (decision := await policy(request, response, attempts_made)):
+                return decision
+        return RetryDecision(self._should_retry(response))
+
+    def _before_attempt(self, request: httpx.Request, attempts_made: int) -> None:
+        if self._circuit_breaker:
+            self._circuit_breaker.before_request(request.url.host)
+        if self._retry_budget and attempts_made == 0:
+            self._retry_budget.record_request()
+
+    def _record_outcome(self, request: httpx.Request, failed: bool | None) -> None:
+        if self._circuit_breaker:
+            self._circuit_breaker.record(request.url.host, failed)
+
+    def _can_retry_within_deadline(self, sleep_time: float) -> bool:
+        # there's no point in retrying if the deadline passes while waiting to
+        remaining = time_remaining()
+        return remaining is None or sleep_time < remaining
+
+    def _spend_retry(self) -> bool:
+        return self._retry_budget is None or self._retry_budget.try_spend()
+
+    def _start_cooldown(self, host: str, duration: float) -> None:
+        # one 429 holds back every request to the host, not just the one that got it
+        deadline = time.monotonic() + duration
+        if deadline > self._cooldowns.get(host, (0.0, 0.0))[0]:
+            self._cooldowns[host] = (deadline, duration)
+
+    def _cooldown_remaining(self, request: httpx.Request) -> float:
+        if request.extensions.get("dont_handle_ratelimit", False):
+            return 0.0
+
+        host = request.url.host
+        if (cooldown := self._cooldowns.get(host)) is None:
+            return 0.0
+
+        deadline, duration = cooldown
+        remaining = deadline - time.monotonic()
+        if remaining <= 0:
+            del self._cooldowns[host]
+            return 0.0
+
+        # spread requests out after the deadline so they don't all fire at once
+        jitter = random.uniform(0, duration * self._jitter_ratio)  # noqa: S311
+        return remaining + jitter
+
     def _log_failure(
         self,
         request: httpx.Request,
@@ -268,34 +727,85 @@ class RetryTransport(httpx.AsyncBaseTransport, httpx.BaseTransport):
         attempts_made = 0
         response: httpx.Response | None = None
         error: Exception | None = None
+        decision: RetryDecision | None = None
+        sleep_time = 0.0
 
         while True:
             if attempts_made > 0:
-                sleep_time = self._calculate_sleep(
-                    attempts_made, response.headers if response else {}
-                )
                 self._log_failure(request, sleep_time, response, error)
-                await anyio.sleep(sleep_time)
+                # 429s start a cooldown for the whole host, which is waited on below
+                if response is None or response.status_code != 429:
+                    await anyio.sleep(sleep_time)
+
+                if decision and decision.headers:
+                    request.headers.update(decision.headers)
+
+            while (cooldown := self._cooldown_remaining(request)) > 0:
+                await anyio.sleep(cooldown)
 
             error = None
             response = None
+            decision = None
+            self._before_attempt(request, attempts_made)
             try:
                 response = await send_method(request)
-                response.request = request
-
+            except httpx.HTTPError as e:
+                self._record_outcome(request, True)
+                error = e
+                sleep_time = self._calculate_sleep(attempts_made + 1, {})
                 if (
-                    request.extensions.get("dont_handle_ratelimit", False)
-                    and response.status_code == 429
+                    remaining_attempts < 1
+                    or not self._can_retry_within_deadline(sleep_time)
+                    or not self._spend_retry()
                 ):
+                    raise
+            except BaseException:
+                self._record_outcome(request, None)
+                raise
+            else:
+                self._record_outcome(
+                    request, response.status_code in FAILURE_STATUS_CODES
+                )
+                response.request = request
+
+                if response.status_code == 429:
+                    self._start_cooldown(
+                        request.url.host,
+                        self._calculate_sleep(attempts_made + 1, response.headers),
+                    )
+                    if request.extensions.get("dont_handle_ratelimit", False):
+                        return response
+
+                if remaining_attempts < 1:
                     return response
 
-                if remaining_attempts < 1 or not (self._should_retry(response)):
+                # outside the try above, as a policy failing (like a token refresh
+                # a 401 set off) isn't a transport error that retrying can fix
+                try:
+                    decision = await self._decide_retry(
+                        request, response, attempts_made
+                    )
+                except BaseException:
+                    # the response is never handed back, so it has to be closed
+                    # here, or its connection is never released
+                    with anyio.CancelScope(shield=True):
+                        await response.aclose()
+                    raise
+
+                if not decision.retry:
+                    return response
+
+                if decision.wait is not None:
+                    sleep_time = decision.wait
+                else:
+                    sleep_time = self._calculate_sleep(
+                        attempts_made + 1, response.headers
+                    )
+                if not self._can_retry_within_deadline(sleep_time):
+                    return response
+                if not self._spend_retry():
                     return response
                 await response.aclose()
-            except httpx.HTTPError as e:
-                error = e
-                if remaining_attempts < 1:
-                    raise
             attempts_made += 1
             remaining_attempts -= 1
 
@@ -314,26 +824,45 @@ class RetryTransport(httpx.AsyncBaseTransport, httpx.BaseTransport):
                     attempts_made, response.headers if response else {}
                 )
                 self._log_failure(request, sleep_time, response, error)
-                time.sleep(sleep_time)
+                # 429s start a cooldown for the whole host, which is waited on below
+                if response is None or response.status_code != 429:
+                    time.sleep(sleep_time)
+
+            while (cooldown := self._cooldown_remaining(request)) > 0:
+                time.sleep(cooldown)
 
             error = None
             response = None
+            self._before_attempt(request, attempts_made)
             try:
                 response = send_method(request)
+                self._record_outcome(
+                    request, response.status_code in FAILURE_STATUS_CODES
+                )
                 response.request = request
 
-                if (
-                    request.extensions.get("dont_handle_ratelimit", False)
-                    and response.status_code == 429
-                ):
-                    return response
+                if response.status_code == 429:
+                    self._start_cooldown(
+                        request.url.host,
+                        self._calculate_sleep(attempts_made + 1, response.headers),
+                    )
+                    if request.extensions.get("dont_handle_ratelimit", False):
+                        return response
 
                 if remaining_attempts < 1 or not self._should_retry(response):
                     return response
+                if not self._spend_retry():
+                    return response
                 response.close()
             except httpx.HTTPError as e:
+                if response is None:
+                    self._record_outcome(request, True)
                 error = e
-                if remaining_attempts < 1:
+                if remaining_attempts < 1 or not self._spend_retry():
                     raise
+            except BaseException:
+                if response is None:
+                    self._record_outcome(request, None)
+                raise
             attempts_made += 1
             remaining_attempts -= 1
@@ -0,0 +1,289 @@
+"""
+MIT License
+
+Copyright (c) 2023-2024 AstreaTSS
+
+Permission is hereby granted, free of charge, to any person obtaining a copy
+of this software and associated documentation files (the "Software"), to deal
+in the Software without restriction, including without limitation the rights
+to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+copies of the Software, and to permit persons to whom the Software is
+furnished to do so, subject to the following conditions:
+
+The above copyright notice and this permission notice shall be included in all
+copies or substantial portions of the Software.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+SOFTWARE.
+"""
+
+import typing
+
+import httpx
+import msgspec
+
+from elytra.priorities import PrioritySemaphore, request_priority
+from elytra.rate_limit import RateLimit, RateLimitBudget, RateLimitTransport
+from elytra.retry_transport import (
+    CircuitBreaker,
+    RequestHedger,
+    RetryBudget,
+    RetryTransport,
+)
+
+__all__ = ("HostPoolStats", "SessionFactory")
+
+DEFAULT_LIMITS = httpx.Limits(
+    max_connections=100, max_keepalive_connections=20, keepalive_expiry=5.0
+)
+DEFAULT_TIMEOUT = httpx.Timeout(5.0, read=30.0)
+
+
+class HostPoolStats(msgspec.Struct, kw_only=True):
+    host: str
+    connections: int = 0
+    idle_connections: int = 0
+    active_streams: int = 0
+    waiting_streams: int = 0
+
+
+class _HostState:
+    __slots__ = ("semaphore", "active", "waiting")
+
+    def __init__(self, max_streams: typing.Optional[int]) -> None:
+        self.semaphore = PrioritySemaphore(max_streams) if max_streams else None
+        self.active = 0
+        self.waiting = 0
+
+
+class _ReleasingStream(httpx.AsyncByteStream):
+    def __init__(
+        self, stream: httpx.AsyncByteStream, release: typing.Callable[[], None]
+    ) -> None:
+        self._stream = stream
+        self._release = release
+        self._released = False
+
+    async def __aiter__(self) -> typing.AsyncIterator[bytes]:
+        async for chunk in self._stream:
+            yield chunk
+
+    async def aclose(self) -> None:
+        try:
+            await self._stream.aclose()
+        finally:
+            if not self._released:
+                self._released = True
+                self._release()
+
+
+class StreamLimitTransport(httpx.AsyncBaseTransport):
+    """
+    Wraps an HTTP transport, keeping track of (and optionally limiting) how many
+    requests are in flight per host at once.
+
+    A request counts as in flight until its response is closed, as that is when
+    its HTTP/2 stream is done with. When limited, waiting requests are let in by
+    priority (see `Priority`).
+    """
+
+    def __init__(
+        self,
+        wrapped_transport: httpx.AsyncHTTPTransport,
+        max_streams_per_host: typing.Optional[int] = None,
+    ) -> None:
+        self._wrapped_transport = wrapped_transport
+        self._max_streams_per_host = max_streams_per_host
+        self._hosts: dict[str, _HostState] = {}
+
+    def _host_state(self, host: str) -> _HostState:
+        if (state := self._hosts.get(host)) is None:
+            state = self._hosts[host] = _HostState(self._max_streams_per_host)
+        return state
+
+    async def handle_async_request(self, request: httpx.Request) -> httpx.Response:
+        state = self._host_state(request.url.host)
+
+        if state.semaphore:
+            state.waiting += 1
+            try:
+                await state.semaphore.acquire(request_priority(request))
+            finally:
+                state.waiting -= 1
+
+        state.active += 1
+
+        def release() -> None:
+            state.active -= 1
+            if state.semaphore:
+                state.semaphore.release()
+
+        try:
+            response = await self._wrapped_transport.handle_async_request(request)
+        except BaseException:
+            release()
+            raise
+
+        return httpx.Response(
+            status_code=response.status_code,
+            headers=response.headers,
+            stream=_ReleasingStream(response.stream, release),  # type: ignore
+            extensions=response.extensions,
+        )
+
+    def pool_stats(self) -> dict[str, HostPoolStats]:
+        stats = {
+            host: HostPoolStats(
+                host=host,
+                active_streams=state.active,
+                waiting_streams=state.waiting,
+            )
+            for host, state in self._hosts.items()
+        }
+
+        for connection in self._wrapped_transport._pool.connections:
+            origin = getattr(connection, "_origin", None)
+            if origin is None:
+                continue
+
+            host = origin.host.decode("ascii")
+            if (host_stats := stats.get(host)) is None:
+                host_stats = stats[host] = HostPoolStats(host=host)
+
+            host_stats.connections += 1
+            if connection.is_idle():
+                host_stats.idle_connections += 1
+
+        return stats
+
+    async def aclose(self) -> None:
+        await self._wrapped_transport.aclose()
+
+
+class SessionFactory:
+    """
+    Builds the HTTP session used by the API classes.
+
+    Passing the same factory to multiple APIs makes them share one session, and
+    so one connection pool - the factory owns the session, so close it with
+    `aclose` once every API using it is done.
+
+    Args:
+        limits: The connection pool limits to use.
+        keepalive_expiry: How long idle connections are kept around, in seconds. \
+            Overrides the value in `limits` if given.
+        max_streams_per_host: The maximum number of requests in flight to one host \
+            at once. Unlimited by default.
+        timeout: The timeout configuration for requests.
+        rate_limits: If given, requests are held back to stay within these budgets, \
+            keyed by endpoint family (see `RateLimitTransport`). Pass an empty \
+            dictionary to only follow the budgets the server reports.
+        circuit_breaker: If given, requests to hosts that keep failing fail straight \
+            away instead of being sent. Its `states` method shows each host's state.
+        retry_budget: If given, caps retries at a ratio of recent requests.
+        hedger: If given, a second copy of slow idempotent requests is sent, and \
+            whichever response arrives first is used.
+    """
+
+    __slots__ = (
+        "limits",
+        "max_streams_per_host",
+        "timeout",
+        "rate_limits",
+        "circuit_breaker",
+        "retry_budget",
+        "hedger",
+        "_transport",
+        "_rate_limit_transport",
+        "_session",
+    )
+
+    limits: httpx.Limits
+    max_streams_per_host: typing.Optional[int]
+    timeout: httpx.Timeout
+    rate_limits: typing.Optional[dict[str, RateLimit]]
+    circuit_breaker: typing.Optional[CircuitBreaker]
+    retry_budget: typing.Optional[RetryBudget]
+    hedger: typing.Optional[RequestHedger]
+
+    def __init__(
+        self,
+        *,
+        limits: typing.Optional[httpx.Limits] = None,
+        keepalive_expiry: typing.Optional[float] = None,
+        max_streams_per_host: typing.Optional[int] = None,
+        timeout: httpx.Timeout = DEFAULT_TIMEOUT,
+        rate_limits: typing.Optional[typing.Mapping[str, RateLimit]] = None,
+        circuit_breaker: typing.Optional[CircuitBreaker] = None,
+        retry_budget: typing.Optional[RetryBudget] = None,
+        hedger: typing.Optional[RequestHedger] = None,
+    ) -> None:
+        limits = limits or DEFAULT_LIMITS
+        if keepalive_expiry is not None:
+            limits = httpx.Limits(
+                max_connections=limits.max_connections,
+                max_keepalive_connections=limits.max_keepalive_connections,
+                keepalive_expiry=keepalive_expiry,
+            )
+
+        self.limits = limits
+        self.max_streams_per_host = max_streams_per_host
+        self.timeout = timeout
+        self.rate_limits = dict(rate_limits) if rate_limits is not None else None
+        self.circuit_breaker = circuit_breaker
+        self.retry_budget = retry_budget
+        self.hedger = hedger
+
+        self._transport: typing.Optional[StreamLimitTransport] = None
+        self._rate_limit_transport: typing.Optional[RateLimitTransport] = None
+        self._session: typing.Optional[httpx.AsyncClient] = None
+
+    @property
+    def session(self) -> httpx.AsyncClient:
+        if self._session is None:
+            self._transport = StreamLimitTransport(
+                httpx.AsyncHTTPTransport(http2=True, retries=2, limits=self.limits),
+                max_streams_per_host=self.max_streams_per_host,
+            )
+
+            # sits below the retries so that they are held back too, and above the
+            # stream limit so that waiting for a budget doesn't take up a stream
+            transport: httpx.AsyncBaseTransport = self._transport
+            if self.rate_limits is not None:
+                transport = self._rate_limit_transport = RateLimitTransport(
+                    self._transport, self.rate_limits
+                )
+
+            self._session = httpx.AsyncClient(
+                transport=RetryTransport(
+                    wrapped_transport=transport,
+                    jitter_ratio=0.3,
+                    circuit_breaker=self.circuit_breaker,
+                    retry_budget=self.retry_budget,
+                    hedger=self.hedger,
+                ),
+                http2=True,
+                timeout=self.timeout,
+            )
+        return self._session
+
+    def pool_stats(self) -> dict[str, HostPoolStats]:
+        """Get statistics about the connection pool, per host."""
+        if self._transport is None:
+            return {}
+        return self._transport.pool_stats()
+
+    def budgets(self) -> dict[str, RateLimitBudget]:
+        """Get the current rate limit budget of each endpoint family."""
+        if self._rate_limit_transport is None:
+            return {}
+        return self._rate_limit_transport.budgets()
+
+    async def aclose(self) -> None:
+        if self._session is not None:
+            await self._session.aclose()
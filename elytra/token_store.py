@@ -0,0 +1,148 @@
+"""
+MIT License
+
+Copyright (c) 2023-2024 AstreaTSS
+
+Permission is hereby granted, free of charge, to any person obtaining a copy
+of this software and associated documentation files (the "Software"), to deal
+in the Software without restriction, including without limitation the rights
+to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+copies of the Software, and to permit persons to whom the Software is
+furnished to do so, subject to the following conditions:
+
+The above copyright notice and this permission notice shall be included in all
+copies or substantial portions of the Software.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+SOFTWARE.
+"""
+
+import contextlib
+import os
+import sys
+import tempfile
+import typing
+
+import anyio
+
+__all__ = ("FileTokenStore", "SharedFileTokenStore")
+
+LOCK_POLL_INTERVAL = 0.05
+
+if sys.platform == "win32":
+    import msvcrt
+
+    def _try_lock(fd: int) -> bool:
+        try:
+            msvcrt.locking(fd, msvcrt.LK_NBLCK, 1)
+        except OSError:
+            return False
+        return True
+
+    def _unlock(fd: int) -> None:
+        msvcrt.locking(fd, msvcrt.LK_UNLCK, 1)
+
+else:
+    import fcntl
+
+    def _try_lock(fd: int) -> bool:
+        try:
+            fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except BlockingIOError:
+            return False
+        return True
+
+    def _unlock(fd: int) -> None:
+        fcntl.flock(fd, fcntl.LOCK_UN)
+
+
+def _atomic_write(path: str, data: bytes) -> None:
+    directory = os.path.dirname(os.path.abspath(path))
+    fd, tmp_path = tempfile.mkstemp(
+        dir=directory, prefix=f".{os.path.basename(path)}.", suffix=".tmp"
+    )
+
+    try:
+        with os.fdopen(fd, "wb") as f:
+            f.write(data)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, path)
+    except BaseException:
+        with contextlib.suppress(FileNotFoundError):
+            os.remove(tmp_path)
+        raise
+
+
+class FileTokenStore:
+    """
+    Stores tokens in a JSON file on disk.
+
+    Writes go to a temporary file that is then renamed over the original, so the
+    file is never left half-written.
+    """
+
+    __slots__ = ("path", "_lock")
+
+    path: str
+
+    def __init__(self, path: str | os.PathLike[str]) -> None:
+        self.path = os.fspath(path)
+        self._lock = anyio.Lock()
+
+    async def load(self) -> typing.Optional[bytes]:
+        try:
+            return await anyio.Path(self.path).read_bytes()
+        except FileNotFoundError:
+            return None
+
+    async def save(self, data: bytes) -> None:
+        await anyio.to_thread.run_sync(_atomic_write, self.path, data)
+
+    @contextlib.asynccontextmanager
+    async def lock(self) -> typing.AsyncIterator[None]:
+        async with self._lock:
+            yield
+
+
+class SharedFileTokenStore(FileTokenStore):
+    """
+    A file token store that can be shared between processes.
+
+    The lock is also held as an OS-level lock on a `.lock` file next to the token
+    file. Because tokens are re-read under the lock before being refreshed, only
+    one process refreshes a given token - the rest pick up what it wrote.
+    """
+
+    __slots__ = ("lock_path",)
+
+    lock_path: str
+
+    def __init__(
+        self,
+        path: str | os.PathLike[str],
+        lock_path: str | os.PathLike[str] | None = None,
+    ) -> None:
+        super().__init__(path)
+        self.lock_path = os.fspath(lock_path) if lock_path else f"{self.path}.lock"
+
+    @contextlib.asynccontextmanager
+    async def lock(self) -> typing.AsyncIterator[None]:
+        async with self._lock:
+            fd = os.open(self.lock_path, os.O_RDWR | os.O_CREAT, 0o600)
+            try:
+                # poll rather than block a worker thread, so waiting stays cancellable
+                while not _try_lock(fd):
+                    await anyio.sleep(LOCK_POLL_INTERVAL)
+
+                try:
+                    yield
+                finally:
+                    _unlock(fd)
+            finally:
+                os.close(fd)
@@ -41,12 +41,17 @@ __all__ = (
     "ClubHandler",
 )
 
+HEADERS = {"x-xbl-contract-version": "4", "Accept-Language": "en-US"}
+
 
 class ClubHandler(HandlerProtocol):
+    HOSTS: tuple[str, ...] = ("clubhub.xboxlive.com",)
+
     async def fetch_club_presence(self, club_id: int | str) -> ClubResponse:
-        HEADERS = {"x-xbl-contract-version": "4", "Accept-Language": "en-US"}
         url = (
             f"https://clubhub.xboxlive.com/clubs/Ids({club_id})/decoration/clubpresence"
         )
 
-        return await ClubResponse.from_response(await self.get(url, headers=HEADERS))
+        return await self.request_model(
+            ClubResponse, "GET", url, endpoint="fetch_club_presence", headers=HEADERS
+        )
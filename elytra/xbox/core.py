@@ -22,6 +22,8 @@ OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
 SOFTWARE.
 """
 
+import typing
+
 from elytra import BaseMicrosoftAPI
 from elytra.const import XBOX_API_RELYING_PARTY
 
@@ -45,5 +47,13 @@ class XboxAPI(
 ):
     RELYING_PARTY: str = XBOX_API_RELYING_PARTY
 
-    async def establish_rta(self) -> RTA:
-        return await RTA.establish(self.base_headers)
+    async def _rta_headers(self) -> dict[str, str]:
+        await self.auth_mgr.refresh_tokens(relying_party=self.RELYING_PATH)
+        return self.base_headers
+
+    async def establish_rta(self, **kwargs: typing.Any) -> RTA:
+        """
+        Connect to RTA. The headers are fetched again, refreshing the XSTS token if
+        needed, every time it reconnects.
+        """
+        return await RTA.establish(self._rta_headers, **kwargs)
@@ -44,68 +44,71 @@ __all__ = (
     "SafetySettings",
 )
 
+HEADERS_V1 = {"x-xbl-contract-version": "1"}
+HEADERS_V2 = {"x-xbl-contract-version": "2"}
+
 
 class MessageHandler(HandlerProtocol):
+    HOSTS: tuple[str, ...] = ("xblmessaging.xboxlive.com",)
+
     async def fetch_inbox(
         self, max_items: int = 100, **kwargs: typing.Any
     ) -> InboxResponse:
         URL = "https://xblmessaging.xboxlive.com/network/Xbox/users/me/inbox"
-        HEADERS = {"x-xbl-contract-version": "1"}
-
-        return await InboxResponse.from_response(
-            await self.get(
-                URL,
-                headers=HEADERS,
-                params={"maxItems": max_items},
-                **kwargs,
-            )
+
+        return await self.request_model(
+            InboxResponse,
+            "GET",
+            URL,
+            endpoint="fetch_inbox",
+            headers=HEADERS_V1,
+            params={"maxItems": max_items},
+            **kwargs,
         )
 
     async def fetch_folder(
         self, folder: str = "Primary", max_items: int = 100, **kwargs: typing.Any
     ) -> Folder:
         URL = f"https://xblmessaging.xboxlive.com/network/Xbox/users/me/inbox/{folder}"
-        HEADERS = {"x-xbl-contract-version": "1"}
-
-        return await Folder.from_response(
-            await self.get(
-                URL,
-                headers=HEADERS,
-                params={"maxItems": max_items},
-                **kwargs,
-            )
+
+        return await self.request_model(
+            Folder,
+            "GET",
+            URL,
+            endpoint="fetch_folder",
+            headers=HEADERS_V1,
+            params={"maxItems": max_items},
+            **kwargs,
         )
 
     async def fetch_conversation(
         self, xuid: str | int, max_items: int = 100, **kwargs: typing.Any
     ) -> ConversationResponse:
         url = f"https://xblmessaging.xboxlive.com/network/Xbox/users/me/conversations/users/xuid({xuid})"
-        HEADERS = {"x-xbl-contract-version": "1"}
-
-        return await ConversationResponse.from_response(
-            await self.get(
-                url,
-                headers=HEADERS,
-                params={"maxItems": max_items},
-                **kwargs,
-            )
+
+        return await self.request_model(
+            ConversationResponse,
+            "GET",
+            url,
+            endpoint="fetch_conversation",
+            headers=HEADERS_V1,
+            params={"maxItems": max_items},
+            **kwargs,
         )
 
     async def _update_conversation(
         self, payload: dict, **kwargs: typing.Any
     ) -> httpx.Response:
-        HEADERS = {"x-xbl-contract-version": "2"}
         return await self.put(
             "https://xblmessaging.xboxlive.com/network/Xbox/users/me/conversations/horizon",
             json=payload,
-            headers=HEADERS,
+            headers=HEADERS_V2,
             **kwargs,
         )
 
     async def delete_conversation(
         self, conversation_id: str | UUID, horizon: str | int, **kwargs: typing.Any
     ) -> None:
-        HEADERS = {"x-xbl-contract-version": "2"}
         payload = {
             "conversations": [
                 {
@@ -119,16 +122,15 @@ class MessageHandler(HandlerProtocol):
         await self.put(
             "https://xblmessaging.xboxlive.com/network/Xbox/users/me/conversations/horizon",
             json=payload,
-            headers=HEADERS,
+            headers=HEADERS_V2,
             **kwargs,
         )
 
     async def delete_folder_conversations(
         self, folder: str = "Primary", **kwargs: typing.Any
     ) -> None:
-        HEADERS = {"x-xbl-contract-version": "2"}
         await self.delete(
             f"https://xblmessaging.xboxlive.com/network/xbox/users/me/conversations/horizon/{folder}",
-            headers=HEADERS,
+            headers=HEADERS_V2,
             **kwargs,
         )
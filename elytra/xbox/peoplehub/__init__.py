@@ -24,6 +24,7 @@ SOFTWARE.
 
 import typing
 
+from elytra.chunking import ChunkError, fetch_in_chunks
 from elytra.protocols import HandlerProtocol
 
 from .models import *
@@ -49,22 +50,89 @@ __all__ = (
     "PeopleHubHandler",
 )
 
+HEADERS = {"x-xbl-contract-version": "3", "Accept-Language": "en-US"}
+MAX_BATCH_SIZE = 100
+
 
 class PeopleHubHandler(HandlerProtocol):
+    HOSTS: tuple[str, ...] = ("peoplehub.xboxlive.com",)
+
     async def fetch_people_batch(
         self,
         xuid_list: list[str] | list[int],
         *,
         decoration: str = "presencedetail",
+        chunk_size: int = MAX_BATCH_SIZE,
+        max_concurrency: int = 4,
         **kwargs: typing.Any,
     ) -> PeopleHubResponse:
-        HEADERS = {"x-xbl-contract-version": "3", "Accept-Language": "en-US"}
+        """
+        Fetch information about multiple users.
+
+        Lists longer than `chunk_size` are split up and fetched concurrently. If any
+        chunk fails, its exception is raised - use `fetch_people_batch_chunked` to
+        get the people from the chunks that succeeded anyway.
+        """
+        resp, failed_chunks = await self.fetch_people_batch_chunked(
+            xuid_list,
+            decoration=decoration,
+            chunk_size=chunk_size,
+            max_concurrency=max_concurrency,
+            **kwargs,
+        )
+        if failed_chunks:
+            raise failed_chunks[0].error
+        return resp
+
+    async def fetch_people_batch_chunked(
+        self,
+        xuid_list: list[str] | list[int],
+        *,
+        decoration: str = "presencedetail",
+        chunk_size: int = MAX_BATCH_SIZE,
+        max_concurrency: int = 4,
+        **kwargs: typing.Any,
+    ) -> tuple[PeopleHubResponse, list[ChunkError]]:
+        """
+        Fetch information about multiple users, like `fetch_people_batch`.
+
+        Chunks that fail don't fail the whole call - the people from the rest are
+        returned, along with the chunks that failed. If every chunk fails, the first
+        chunk's exception is raised.
+        """
         URL = f"https://peoplehub.xboxlive.com/users/me/people/batch/decoration/{decoration}"
-        return await PeopleHubResponse.from_response(
-            await self.post(
+
+        # only reads data, so it is safe to send twice if it's slow - unless the
+        # caller says otherwise
+        kwargs["extensions"] = {"hedge": True, **kwargs.get("extensions", {})}
+
+        async def fetch_chunk(chunk: list[str] | list[int]) -> PeopleHubResponse:
+            return await self.request_model(
+                PeopleHubResponse,
+                "POST",
                 URL,
+                endpoint="fetch_people_batch",
                 headers=HEADERS,
-                json={"xuids": xuid_list},
+                json={"xuids": chunk},
                 **kwargs,
             )
+
+        results, failed_chunks = await fetch_in_chunks(
+            xuid_list,
+            fetch_chunk,
+            chunk_size=chunk_size,
+            max_concurrency=max_concurrency,
+        )
+        if len(results) == 1:
+            return results[0], failed_chunks
+
+        first = results[0]
+        return (
+            PeopleHubResponse(
+                people=[person for resp in results for person in resp.people],
+                recommendation_summary=first.recommendation_summary,
+                friend_finder_state=first.friend_finder_state,
+                account_link_details=first.account_link_details,
+            ),
+            failed_chunks,
         )
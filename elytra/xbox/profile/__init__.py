@@ -24,45 +24,127 @@ SOFTWARE.
 
 import typing
 
+from elytra.chunking import ChunkError, fetch_in_chunks
 from elytra.protocols import HandlerProtocol
 
+from .batcher import *
 from .models import *
+from .resolver import *
 
-__all__ = ("ProfileHandler", "ProfileUser", "ProfileResponse", "Setting")
+__all__ = (
+    "GamertagResolver",
+    "ProfileBatcher",
+    "ProfileHandler",
+    "ProfileUser",
+    "ProfileResponse",
+    "Setting",
+)
+
+HEADERS = {"x-xbl-contract-version": "3"}
+PARAMS = {"settings": "Gamertag"}
+MAX_BATCH_SIZE = 100
 
 
 class ProfileHandler(HandlerProtocol):
+    HOSTS: tuple[str, ...] = ("profile.xboxlive.com",)
+
     async def fetch_profiles(
-        self, xuid_list: list[str] | list[int], **kwargs: typing.Any
+        self,
+        xuid_list: list[str] | list[int],
+        *,
+        chunk_size: int = MAX_BATCH_SIZE,
+        max_concurrency: int = 4,
+        **kwargs: typing.Any,
     ) -> ProfileResponse:
+        """
+        Fetch the profiles of multiple users.
+
+        Lists longer than `chunk_size` are split up and fetched concurrently. If any
+        chunk fails, its exception is raised - use `fetch_profiles_chunked` to get
+        the profiles from the chunks that succeeded anyway.
+        """
+        resp, failed_chunks = await self.fetch_profiles_chunked(
+            xuid_list,
+            chunk_size=chunk_size,
+            max_concurrency=max_concurrency,
+            **kwargs,
+        )
+        if failed_chunks:
+            raise failed_chunks[0].error
+        return resp
+
+    async def fetch_profiles_chunked(
+        self,
+        xuid_list: list[str] | list[int],
+        *,
+        chunk_size: int = MAX_BATCH_SIZE,
+        max_concurrency: int = 4,
+        **kwargs: typing.Any,
+    ) -> tuple[ProfileResponse, list[ChunkError]]:
+        """
+        Fetch the profiles of multiple users, like `fetch_profiles`.
+
+        Chunks that fail don't fail the whole call - the profiles from the rest are
+        returned, along with the chunks that failed. If every chunk fails, the first
+        chunk's exception is raised.
+        """
         URL = "https://profile.xboxlive.com/users/batch/profile/settings"
-        HEADERS = {"x-xbl-contract-version": "3"}
-
-        post_data = {
-            "settings": ["Gamertag"],
-            "userIds": xuid_list,
-        }
-        return await ProfileResponse.from_response(
-            await self.post(URL, json=post_data, headers=HEADERS, **kwargs)
+
+        async def fetch_chunk(chunk: list[str] | list[int]) -> ProfileResponse:
+            post_data = {
+                "settings": ["Gamertag"],
+                "userIds": chunk,
+            }
+            return await self.request_model(
+                ProfileResponse,
+                "POST",
+                URL,
+                endpoint="fetch_profiles",
+                json=post_data,
+                headers=HEADERS,
+                **kwargs,
+            )
+
+        results, failed_chunks = await fetch_in_chunks(
+            xuid_list,
+            fetch_chunk,
+            chunk_size=chunk_size,
+            max_concurrency=max_concurrency,
+        )
+        if len(results) == 1:
+            return results[0], failed_chunks
+
+        return (
+            ProfileResponse(
+                profile_users=[user for resp in results for user in resp.profile_users]
+            ),
+            failed_chunks,
         )
 
     async def fetch_profile_by_xuid(
         self, target_xuid: str | int, **kwargs: typing.Any
     ) -> ProfileResponse:
-        HEADERS = {"x-xbl-contract-version": "3"}
-        PARAMS = {"settings": "Gamertag"}
         URL = f"https://profile.xboxlive.com/users/xuid({target_xuid})/profile/settings"
-        return await ProfileResponse.from_response(
-            await self.get(URL, params=PARAMS, headers=HEADERS, **kwargs)
+        return await self.request_model(
+            ProfileResponse,
+            "GET",
+            URL,
+            endpoint="fetch_profile_by_xuid",
+            params=PARAMS,
+            headers=HEADERS,
+            **kwargs,
         )
 
     async def fetch_profile_by_gamertag(
         self, gamertag: str, **kwargs: typing.Any
     ) -> ProfileResponse:
         url = f"https://profile.xboxlive.com/users/gt({gamertag})/profile/settings"
-        HEADERS = {"x-xbl-contract-version": "3"}
-        PARAMS = {"settings": "Gamertag"}
-
-        return await ProfileResponse.from_response(
-            await self.get(url, params=PARAMS, headers=HEADERS, **kwargs)
+        return await self.request_model(
+            ProfileResponse,
+            "GET",
+            url,
+            endpoint="fetch_profile_by_gamertag",
+            params=PARAMS,
+            headers=HEADERS,
+            **kwargs,
         )
@@ -0,0 +1,193 @@
+"""
+MIT License
+
+Copyright (c) 2023-2024 AstreaTSS
+
+Permission is hereby granted, free of charge, to any person obtaining a copy
+of this software and associated documentation files (the "Software"), to deal
+in the Software without restriction, including without limitation the rights
+to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+copies of the Software, and to permit persons to whom the Software is
+furnished to do so, subject to the following conditions:
+
+The above copyright notice and this permission notice shall be included in all
+copies or substantial portions of the Software.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+SOFTWARE.
+"""
+
+import typing
+
+import anyio
+
+from elytra.core import MicrosoftAPIException
+
+from .models import ProfileUser
+
+if typing.TYPE_CHECKING:
+    from . import ProfileHandler
+
+__all__ = ("ProfileBatcher",)
+
+
+def _is_bad_request(error: BaseException) -> bool:
+    return isinstance(error, MicrosoftAPIException) and error.resp.status_code == 400
+
+
+class _PendingBatch:
+    __slots__ = ("xuids", "full", "done", "dispatching", "dispatch_ended", "results")
+
+    def __init__(self) -> None:
+        self.xuids: set[str] = set()
+        self.full = anyio.Event()
+        self.done = anyio.Event()
+        self.dispatching = False
+        self.dispatch_ended = anyio.Event()
+        self.results: dict[str, ProfileUser | Exception] = {}
+
+
+class ProfileBatcher:
+    """
+    Merges profile lookups made close together into one `fetch_profiles` request.
+
+    The first lookup in a batch waits for `window` seconds (or until
+    `max_batch_size` XUIDs have been queued) and then sends the request on
+    behalf of everyone in the batch. If it's cancelled before the request
+    finishes, another lookup waiting on the batch sends it instead.
+
+    A bad XUID makes the whole request it's in fail, so failed requests are split
+    in half and retried until the bad XUIDs are found - only lookups for those fail.
+
+    Args:
+        handler: The handler to fetch profiles with, usually an `XboxAPI`.
+        window: How long to wait for other lookups to join a batch, in seconds.
+        max_batch_size: The most XUIDs to fetch in one request.
+    """
+
+    __slots__ = ("handler", "window", "max_batch_size", "_batch")
+
+    handler: "ProfileHandler"
+    window: float
+    max_batch_size: int
+
+    def __init__(
+        self,
+        handler: "ProfileHandler",
+        *,
+        window: float = 0.01,
+        max_batch_size: int = 100,
+    ) -> None:
+        self.handler = handler
+        self.window = window
+        self.max_batch_size = max_batch_size
+
+        self._batch: typing.Optional[_PendingBatch] = None
+
+    async def fetch(self, xuid: str | int) -> ProfileUser:
+        xuid = str(xuid)
+        batch = self._join(xuid)
+        await self._wait(batch)
+
+        result = self._result(batch, xuid)
+        if isinstance(result, Exception):
+            raise result
+        return result
+
+    async def fetch_many(
+        self, xuids: typing.Iterable[str | int]
+    ) -> dict[str, ProfileUser | Exception]:
+        """
+        Look up multiple XUIDs, batched along with any other lookups.
+
+        Returns the profile for each XUID, or the exception looking it up raised.
+        """
+        joined = {str(xuid): self._join(str(xuid)) for xuid in xuids}
+
+        async with anyio.create_task_group() as tg:
+            for batch in {id(b): b for b in joined.values()}.values():
+                tg.start_soon(self._wait, batch)
+
+        return {xuid: self._result(batch, xuid) for xuid, batch in joined.items()}
+
+    def _join(self, xuid: str) -> _PendingBatch:
+        batch = self._batch
+        if batch is None:
+            batch = self._batch = _PendingBatch()
+
+        batch.xuids.add(xuid)
+        if len(batch.xuids) >= self.max_batch_size:
+            self._batch = None
+            batch.full.set()
+
+        return batch
+
+    def _result(self, batch: _PendingBatch, xuid: str) -> ProfileUser | Exception:
+        return batch.results.get(
+            xuid, ValueError(f"No profile was returned for XUID {xuid}.")
+        )
+
+    async def _wait(self, batch: _PendingBatch) -> None:
+        while not batch.done.is_set():
+            if batch.dispatching:
+                await batch.dispatch_ended.wait()
+                continue
+
+            # nobody is sending the batch (anymore), so this lookup does
+            batch.dispatching = True
+            dispatch_ended = batch.dispatch_ended
+            try:
+                await self._dispatch(batch)
+            finally:
+                batch.dispatching = False
+                batch.dispatch_ended = anyio.Event()
+                dispatch_ended.set()
+
+    async def _dispatch(self, batch: _PendingBatch) -> None:
+        if not batch.full.is_set():
+            with anyio.move_on_after(self.window):
+                await batch.full.wait()
+
+        if self._batch is batch:
+            self._batch = None
+
+        batch.results = await self._fetch(list(batch.xuids))
+        batch.done.set()
+
+    async def _fetch(self, xuids: list[str]) -> dict[str, ProfileUser | Exception]:
+        try:
+            resp, failed_chunks = await self.handler.fetch_profiles_chunked(xuids)
+        except Exception as e:
+            return await self._split(xuids, e)
+
+        results: dict[str, ProfileUser | Exception] = {
+            user.id: user for user in resp.profile_users
+        }
+        for chunk in failed_chunks:
+            results |= await self._split(chunk.items, chunk.error)
+        return results
+
+    async def _split(
+        self, xuids: list[str], error: Exception
+    ) -> dict[str, ProfileUser | Exception]:
+        # only a bad request can be down to a single XUID - anything else would
+        # just fail again
+        if len(xuids) == 1 or not _is_bad_request(error):
+            return dict.fromkeys(xuids, error)
+
+        results: dict[str, ProfileUser | Exception] = {}
+
+        async def fetch_half(half: list[str]) -> None:
+            results.update(await self._fetch(half))
+
+        middle = len(xuids) // 2
+        async with anyio.create_task_group() as tg:
+            tg.start_soon(fetch_half, xuids[:middle])
+            tg.start_soon(fetch_half, xuids[middle:])
+
+        return results
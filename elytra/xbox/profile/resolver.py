@@ -0,0 +1,257 @@
+"""
+MIT License
+
+Copyright (c) 2023-2024 AstreaTSS
+
+Permission is hereby granted, free of charge, to any person obtaining a copy
+of this software and associated documentation files (the "Software"), to deal
+in the Software without restriction, including without limitation the rights
+to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+copies of the Software, and to permit persons to whom the Software is
+furnished to do so, subject to the following conditions:
+
+The above copyright notice and this permission notice shall be included in all
+copies or substantial portions of the Software.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+SOFTWARE.
+"""
+
+import contextlib
+import sqlite3
+import time
+import typing
+from pathlib import Path
+
+import anyio
+
+from elytra.core import MicrosoftAPIException
+
+from .batcher import ProfileBatcher
+from .models import ProfileUser
+
+if typing.TYPE_CHECKING:
+    from . import ProfileHandler
+
+__all__ = ("GamertagResolver",)
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS gamertags (
+    xuid TEXT PRIMARY KEY,
+    gamertag TEXT NOT NULL,
+    resolved_at REAL NOT NULL
+)
+"""
+
+
+def _gamertag_of(user: ProfileUser) -> typing.Optional[str]:
+    return next((s.value for s in user.settings if s.id == "Gamertag"), None)
+
+
+class _Entry(typing.NamedTuple):
+    xuid: str
+    gamertag: str
+    resolved_at: float
+
+
+class GamertagResolver:
+    """
+    Resolves XUIDs to gamertags and gamertags to XUIDs, remembering the results.
+
+    Gamertags are matched case-insensitively. Resolved entries are refetched once
+    they are older than `ttl`, and gamertags that don't exist are remembered as
+    such for `negative_ttl`. XUID lookups that miss are merged into batched
+    `fetch_profiles` requests through a `ProfileBatcher`, including with lookups
+    made at the same time.
+
+    If `path` is given, resolved entries are also stored in an SQLite database there,
+    so that they survive restarts. Unknown gamertags are only remembered in memory.
+
+    Args:
+        handler: The handler to fetch profiles with, usually an `XboxAPI`.
+        ttl: How long a resolved entry is trusted for, in seconds.
+        negative_ttl: How long a gamertag that doesn't exist is remembered, in \
+            seconds.
+        path: Where to store resolved entries, if anywhere.
+        batch_window: How long single XUID lookups wait to be batched together, in \
+            seconds.
+    """
+
+    __slots__ = (
+        "handler",
+        "ttl",
+        "negative_ttl",
+        "path",
+        "_batcher",
+        "_by_xuid",
+        "_by_gamertag",
+        "_unknown_gamertags",
+        "_loaded",
+        "_load_lock",
+    )
+
+    handler: "ProfileHandler"
+    ttl: float
+    negative_ttl: float
+    path: typing.Optional[Path]
+
+    def __init__(
+        self,
+        handler: "ProfileHandler",
+        *,
+        ttl: float = 86400.0,
+        negative_ttl: float = 3600.0,
+        path: typing.Optional[str | Path] = None,
+        batch_window: float = 0.01,
+    ) -> None:
+        self.handler = handler
+        self.ttl = ttl
+        self.negative_ttl = negative_ttl
+        self.path = Path(path) if path else None
+
+        self._batcher = ProfileBatcher(handler, window=batch_window)
+        self._by_xuid: dict[str, _Entry] = {}
+        self._by_gamertag: dict[str, _Entry] = {}
+        self._unknown_gamertags: dict[str, float] = {}
+        self._loaded = self.path is None
+        self._load_lock = anyio.Lock()
+
+    def _is_fresh(self, entry: typing.Optional[_Entry]) -> bool:
+        return entry is not None and time.time() - entry.resolved_at < self.ttl
+
+    def _index(self, entry: _Entry) -> None:
+        if (old := self._by_xuid.get(entry.xuid)) and self._by_gamertag.get(
+            old.gamertag.casefold()
+        ) is old:
+            del self._by_gamertag[old.gamertag.casefold()]
+
+        self._by_xuid[entry.xuid] = entry
+        self._by_gamertag[entry.gamertag.casefold()] = entry
+        self._unknown_gamertags.pop(entry.gamertag.casefold(), None)
+
+    async def _ensure_loaded(self) -> None:
+        if self._loaded:
+            return
+
+        async with self._load_lock:
+            if self._loaded:
+                return
+
+            rows = await anyio.to_thread.run_sync(self._read_rows)
+            for row in rows:
+                entry = _Entry(*row)
+                if (
+                    current := self._by_xuid.get(entry.xuid)
+                ) is None or current.resolved_at < entry.resolved_at:
+                    self._index(entry)
+
+            self._loaded = True
+
+    def _connect(self) -> sqlite3.Connection:
+        conn = sqlite3.connect(self.path)  # type: ignore
+        conn.execute(SCHEMA)
+        return conn
+
+    def _read_rows(self) -> list[tuple[str, str, float]]:
+        with contextlib.closing(self._connect()) as conn:
+            return conn.execute(
+                "SELECT xuid, gamertag, resolved_at FROM gamertags"
+            ).fetchall()
+
+    def _write_rows(self, entries: list[_Entry]) -> None:
+        with contextlib.closing(self._connect()) as conn, conn:
+            conn.executemany(
+                "INSERT OR REPLACE INTO gamertags (xuid, gamertag, resolved_at)"
+                " VALUES (?, ?, ?)",
+                entries,
+            )
+
+    async def _remember(self, users: typing.Iterable[ProfileUser]) -> list[_Entry]:
+        now = time.time()
+        entries = [
+            _Entry(user.id, gamertag, now)
+            for user in users
+            if (gamertag := _gamertag_of(user)) is not None
+        ]
+        for entry in entries:
+            self._index(entry)
+
+        if self.path and entries:
+            await anyio.to_thread.run_sync(self._write_rows, entries)
+        return entries
+
+    async def resolve_gamertags(
+        self, xuids: typing.Iterable[str | int]
+    ) -> dict[str, str]:
+        """
+        Resolve multiple XUIDs to their gamertags.
+
+        XUIDs that couldn't be resolved are left out of the returned dictionary.
+        """
+        await self._ensure_loaded()
+
+        xuids = [str(xuid) for xuid in xuids]
+        misses = list(
+            dict.fromkeys(x for x in xuids if not self._is_fresh(self._by_xuid.get(x)))
+        )
+
+        if misses:
+            results = await self._batcher.fetch_many(misses)
+            await self._remember(
+                r for r in results.values() if not isinstance(r, Exception)
+            )
+
+            # XUIDs that don't exist or aren't valid are just left unresolved
+            for result in results.values():
+                if isinstance(result, Exception) and not (
+                    isinstance(result, ValueError)
+                    or (
+                        isinstance(result, MicrosoftAPIException)
+                        and result.resp.status_code in {400, 404}
+                    )
+                ):
+                    raise result
+
+        return {
+            xuid: entry.gamertag
+            for xuid in xuids
+            if (entry := self._by_xuid.get(xuid)) is not None
+        }
+
+    async def resolve_gamertag(self, xuid: str | int) -> typing.Optional[str]:
+        """Resolve an XUID to its gamertag, or `None` if it couldn't be resolved."""
+        return (await self.resolve_gamertags((xuid,))).get(str(xuid))
+
+    async def resolve_xuid(self, gamertag: str) -> typing.Optional[str]:
+        """Resolve a gamertag to its XUID, or `None` if no such gamertag exists."""
+        await self._ensure_loaded()
+
+        key = gamertag.casefold()
+        entry = self._by_gamertag.get(key)
+        if self._is_fresh(entry):
+            return entry.xuid  # type: ignore
+
+        if (unknown_until := self._unknown_gamertags.get(key)) is not None:
+            if time.time() < unknown_until:
+                return None
+            del self._unknown_gamertags[key]
+
+        try:
+            resp = await self.handler.fetch_profile_by_gamertag(gamertag)
+        except MicrosoftAPIException as e:
+            if e.resp.status_code != 404:
+                raise
+            resp = None
+
+        if not resp or not (entries := await self._remember(resp.profile_users)):
+            if (entry := self._by_gamertag.get(key)) is not None:
+                del self._by_gamertag[key]
+            self._unknown_gamertags[key] = time.time() + self.negative_ttl
+            return None
+
+        return entries[0].xuid
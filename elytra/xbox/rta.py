@@ -23,21 +23,35 @@ SOFTWARE.
 """
 
 import contextlib
+import datetime
 import functools
 import inspect
+import random
 import secrets
 import traceback
 import typing
+import zlib
 from enum import IntEnum
 
 import anyio
+import msgspec
 from anyio.streams.stapled import StapledObjectStream
 from anyio.streams.tls import TLSStream
 from websockets.client import ClientProtocol
 from websockets.frames import Frame, Opcode
 from websockets.uri import parse_uri
 
-__all__ = ("RTAType", "RTA")
+from elytra.deadlines import DeadlineExceeded, deadline
+
+__all__ = (
+    "RTAType",
+    "RTAReconnectEvent",
+    "RTAGapEvent",
+    "RTADispatchStats",
+    "RTAEventStream",
+    "RTA",
+    "RTAPool",
+)
 
 try:
     import orjson
@@ -46,8 +60,6 @@ try:
         return orjson.loads(json_input)
 
 except ImportError:
-    import msgspec
-
     decoder = msgspec.json.Decoder()
 
     def _loads_wrapper(json_input: str | bytes) -> typing.Any:
@@ -58,6 +70,21 @@ def _generate_id() -> bytes:
     return secrets.token_bytes()
 
 
+def _utc_now() -> datetime.datetime:
+    return datetime.datetime.now(datetime.timezone.utc)
+
+
+async def _run_handler(
+    handler: typing.Callable[..., typing.Awaitable[typing.Any]], *args: typing.Any
+) -> None:
+    # handlers run in the task group of whoever connected, so one raising mustn't
+    # take that down
+    try:
+        await handler(*args)
+    except Exception as e:
+        traceback.print_exception(e)
+
+
 class RTAType(IntEnum):
     SUBSCRIBE = 1
     UNSUBSCRIBE = 2
@@ -67,101 +94,522 @@ class RTAType(IntEnum):
 
 PING_INTERVAL = 20.0
 PING_TIMEOUT = 20.0
+SUBSCRIBE_TIMEOUT = 30.0
+RECONNECT_BASE_DELAY = 1.0
+RECONNECT_MAX_DELAY = 60.0
+# how many reconnect attempts in a row can fail before giving up
+MAX_RECONNECT_ATTEMPTS = 10
+# the service caps how many subscriptions one connection can have - this stays
+# a little under it
+MAX_SUBSCRIPTIONS_PER_CONNECTION = 1000
+# how full every connection has to be before the pool opens another one early
+POOL_GROW_THRESHOLD = 0.9
+FAILOVER_AFTER = 60.0
+DISPATCH_WORKERS = 16
+MAX_QUEUED_EVENTS = 1024
+
+DispatchHandler = typing.Callable[[list[typing.Any]], typing.Awaitable[typing.Any]]
+HeadersType = (
+    dict | typing.Callable[[], dict] | typing.Callable[[], typing.Awaitable[dict]]
+)
+OverflowPolicy = typing.Literal["block", "drop_oldest", "coalesce"]
+
+
+class RTAReconnectEvent(msgspec.Struct, kw_only=True):
+    disconnected_at: datetime.datetime
+    reconnected_at: datetime.datetime
+    attempts: int
+    error: typing.Any = None
+
+
+class RTAGapEvent(msgspec.Struct, kw_only=True):
+    """
+    Sent for each subscription after a reconnect. Events between `disconnected_at`
+    and `reconnected_at` were missed - `data` is the state the service sent back
+    when resubscribing, or `error` why resubscribing failed.
+    """
+
+    subscription_id: int
+    url: str
+    disconnected_at: datetime.datetime
+    reconnected_at: datetime.datetime
+    data: typing.Any = None
+    error: typing.Any = None
+
+
+class RTADispatchStats(msgspec.Struct, kw_only=True):
+    queued: int = 0
+    dispatched: int = 0
+    dropped: int = 0
+    coalesced: int = 0
+
+
+class _Subscription:
+    __slots__ = ("id", "url", "handler", "server_id", "pending")
+
+    def __init__(
+        self, subscription_id: int, url: str, handler: DispatchHandler
+    ) -> None:
+        self.id = subscription_id
+        self.url = url
+        self.handler = handler
+        self.server_id: int | None = None
+        # whether subscribe is still waiting to hear back about it
+        self.pending = False
+
+
+class RTAEventStream:
+    """
+    The events of one subscription, as an async iterator.
+
+    Up to `max_buffer` events are held until they're received - after that,
+    events wait in the connection's queue, and what happens when that fills up
+    depends on its overflow policy.
+
+    Closing the stream unsubscribes from the resource. It's also closed when the
+    connection it came from is.
+    """
+
+    __slots__ = (
+        "subscription_id",
+        "_owner",
+        "_send_stream",
+        "_receive_stream",
+        "_arrived",
+    )
+
+    def __init__(self, owner: "RTA | RTAPool", max_buffer: int) -> None:
+        self.subscription_id = 0
+        self._owner = owner
+        self._send_stream, self._receive_stream = anyio.create_memory_object_stream(
+            max_buffer
+        )
+        self._arrived = anyio.Event()
+
+    @classmethod
+    async def _subscribe(
+        cls,
+        owner: "RTA | RTAPool",
+        url: str,
+        max_buffer: int,
+        timeout: float | None,
+    ) -> typing.Self:
+        self = cls(owner, max_buffer)
+        self.subscription_id = await owner.subscribe(url, self._send, timeout=timeout)
+        owner._event_streams.add(self)
+        return self
+
+    async def _send(self, data: list[typing.Any]) -> None:
+        with contextlib.suppress(anyio.BrokenResourceError, anyio.ClosedResourceError):
+            await self._send_stream.send(data)
+        self._arrived.set()
+
+    def _end(self) -> None:
+        self._send_stream.close()
+        self._arrived.set()
+
+    async def receive(self) -> list[typing.Any]:
+        """Wait for the next event. Raises `anyio.EndOfStream` once closed."""
+        return await self._receive_stream.receive()
+
+    async def receive_batch(
+        self, max_items: int = 500, timeout: float = 0.05
+    ) -> list[list[typing.Any]]:
+        """
+        Wait for an event, then return it along with any more that arrive within
+        `timeout` seconds, up to `max_items` in total.
+
+        Raises `anyio.EndOfStream` if the stream is closed before any arrive.
+        """
+        batch = [await self._receive_stream.receive()]
+        give_up_at = anyio.current_time() + timeout
+
+        while len(batch) < max_items:
+            # cancelling a receive can lose the event it was handed, so this waits
+            # to be told one arrived instead
+            self._arrived = arrived = anyio.Event()
+
+            try:
+                batch.append(self._receive_stream.receive_nowait())
+                continue
+            except anyio.WouldBlock:
+                pass
+            except anyio.EndOfStream:
+                break
+
+            with anyio.move_on_after(give_up_at - anyio.current_time()):
+                await arrived.wait()
+            if not arrived.is_set():
+                break
+
+        return batch
+
+    def __aiter__(self) -> typing.Self:
+        return self
+
+    async def __anext__(self) -> list[typing.Any]:
+        try:
+            return await self._receive_stream.receive()
+        except (anyio.EndOfStream, anyio.ClosedResourceError):
+            raise StopAsyncIteration from None
+
+    async def aclose(self) -> None:
+        self._owner._event_streams.discard(self)
+        self._send_stream.close()
+        self._receive_stream.close()
+
+        with contextlib.suppress(ConnectionError):
+            await self._owner.unsubscribe(self.subscription_id)
+
+    async def __aenter__(self) -> typing.Self:
+        return self
+
+    async def __aexit__(self, *_: typing.Any) -> None:
+        await self.aclose()
 
 
 class RTA:
-    def __init__(self, headers: dict | None = None) -> None:
+    """
+    A connection to Xbox Live's Real Time Activity service.
+
+    If the connection drops, it is reconnected with exponential backoff and every
+    active subscription is resubscribed - unless `max_reconnect_attempts` attempts
+    in a row fail, at which point the connection is given up on. Subscription IDs stay the same across
+    reconnects, so events keep going to the same handlers. Afterwards,
+    `reconnect_handler` gets an `RTAReconnectEvent`, and `gap_handler` an
+    `RTAGapEvent` for each subscription, so that what was missed can be resynced.
+
+    Events are queued and handled by a fixed number of workers. When the queue is
+    full, `overflow` decides what happens: `block` stops reading from the
+    connection until there's room, `drop_oldest` discards the oldest queued
+    event, and `coalesce` keeps only the latest queued event for each
+    subscription (and blocks if the queue is full of different subscriptions).
+
+    Args:
+        headers: The headers to connect with, or a function returning them - \
+            called on every (re)connect, so tokens can be refreshed.
+        auto_reconnect: Whether to reconnect if the connection drops.
+        reconnect_handler: A coroutine function called after reconnecting.
+        gap_handler: A coroutine function called for each subscription after \
+            reconnecting.
+        max_reconnect_delay: The longest to wait between reconnect attempts, in \
+            seconds.
+        max_reconnect_attempts: How many reconnect attempts in a row can fail \
+            before giving up. `None` never gives up.
+        dispatch_workers: How many events can be handled at once.
+        max_queued_events: How many events can wait to be handled.
+        overflow: What to do with events that arrive when the queue is full.
+
+    Once the connection is closed or given up on, subscribing raises a
+    `ConnectionError`.
+    """
+
+    def __init__(
+        self,
+        headers: HeadersType | None = None,
+        *,
+        auto_reconnect: bool = True,
+        reconnect_handler: (
+            typing.Callable[[RTAReconnectEvent], typing.Awaitable[typing.Any]] | None
+        ) = None,
+        gap_handler: (
+            typing.Callable[[RTAGapEvent], typing.Awaitable[typing.Any]] | None
+        ) = None,
+        max_reconnect_delay: float = RECONNECT_MAX_DELAY,
+        max_reconnect_attempts: int | None = MAX_RECONNECT_ATTEMPTS,
+        dispatch_workers: int = DISPATCH_WORKERS,
+        max_queued_events: int = MAX_QUEUED_EVENTS,
+        overflow: OverflowPolicy = "block",
+    ) -> None:
+        for handler in (reconnect_handler, gap_handler):
+            if handler is not None and not inspect.iscoroutinefunction(handler):
+                raise ValueError("Event handlers must be coroutine functions.")
+        if overflow not in {"block", "drop_oldest", "coalesce"}:
+            raise ValueError("overflow must be 'block', 'drop_oldest' or 'coalesce'.")
+        if dispatch_workers < 1 or max_queued_events < 1:
+            raise ValueError("There must be at least one worker and queue slot.")
+
         self._uri = parse_uri("wss://rta.xboxlive.com/connect")
         self._headers = headers or {}
         self._protocol = ClientProtocol(self._uri)
         self._stream: TLSStream | None = None
 
+        self.auto_reconnect = auto_reconnect
+        self.reconnect_handler = reconnect_handler
+        self.gap_handler = gap_handler
+        self.max_reconnect_delay = max_reconnect_delay
+        self.max_reconnect_attempts = max_reconnect_attempts
+
         self._tg = anyio.create_task_group()
         self._exit_stack = contextlib.AsyncExitStack()
+        self._connection_scope: anyio.CancelScope | None = None
+        self._connected = anyio.Event()
+        self._closed = False
+        self._disconnect_error: Exception | None = None
 
         self._last_sequence_number = 0
-        self._endpoint_maps: dict[
-            int, typing.Callable[[list[typing.Any]], typing.Awaitable[typing.Any]]
-        ] = {}
+        self._last_subscription_id = 0
+        self._subscriptions: dict[int, _Subscription] = {}
+        self._server_ids: dict[int, int] = {}
         self._subscribe_listeners: dict[
             int, typing.Callable[[list[typing.Any]], typing.Awaitable[typing.Any]]
         ] = {}
         self._stapled_stream_set: set[StapledObjectStream] = set()
 
         self._ping_tasks: dict[bytes, anyio.Event] = {}
+        # frames from concurrent subscribes, pings and pongs mustn't interleave
+        self._send_lock = anyio.Lock()
+
+        self.dispatch_workers = dispatch_workers
+        self.overflow = overflow
+        # with coalesce, only subscriptions are queued - their latest event is here
+        self._dispatch_send, self._dispatch_receive = anyio.create_memory_object_stream(
+            max_queued_events
+        )
+        self._coalesced_events: dict[int, list[typing.Any]] = {}
+        self._dispatch_stats = RTADispatchStats()
+        self._event_streams: set[RTAEventStream] = set()
 
     @classmethod
-    async def establish(cls, headers: dict | None = None) -> typing.Self:
-        self = cls(headers=headers)
+    async def establish(
+        cls, headers: HeadersType | None = None, **kwargs: typing.Any
+    ) -> typing.Self:
+        self = cls(headers=headers, **kwargs)
         await self.connect()
         return self
 
+    @property
+    def connected(self) -> bool:
+        return self._connected.is_set() and not self._closed
+
+    @property
+    def closed(self) -> bool:
+        """Whether the connection was closed or given up on, for good."""
+        return self._closed
+
     async def connect(self) -> None:
-        self._stream = await anyio.connect_tcp(
-            self._uri.host, self._uri.port, tls=True, tls_standard_compatible=False
-        )
+        await self._open_connection()
+
+        await self._exit_stack.enter_async_context(self._tg)
+        self._tg.start_soon(self._run)
+        for _ in range(self.dispatch_workers):
+            self._tg.start_soon(self._dispatch_worker)
 
-        request = self._protocol.connect()
-        request.headers.update(self._headers)
-        self._protocol.send_request(request)
+    async def _resolve_headers(self) -> dict:
+        if not callable(self._headers):
+            return self._headers
 
-        for data in self._protocol.data_to_send():
-            await self._stream.send(data)
+        headers = self._headers()
+        if inspect.isawaitable(headers):
+            headers = await headers
+        return headers  # type: ignore
+
+    async def _open_connection(self) -> None:
+        headers = await self._resolve_headers()
+
+        self._protocol = ClientProtocol(self._uri)
+        stream = await anyio.connect_tcp(
+            self._uri.host, self._uri.port, tls=True, tls_standard_compatible=False
+        )
 
         try:
-            data = await self._stream.receive()
-        except anyio.EndOfStream:
-            self._protocol.receive_eof()
+            request = self._protocol.connect()
+            request.headers.update(headers)
+            self._protocol.send_request(request)
+
             for data in self._protocol.data_to_send():
-                await self._stream.send(data)
+                await stream.send(data)
 
-            raise ConnectionError("Connection closed.") from None
+            try:
+                data = await stream.receive()
+            except anyio.EndOfStream:
+                self._protocol.receive_eof()
+                for data in self._protocol.data_to_send():
+                    await stream.send(data)
 
-        self._protocol.receive_data(data)
+                raise ConnectionError("Connection closed.") from None
 
-        if self._protocol.handshake_exc is not None:
-            raise self._protocol.handshake_exc
+            self._protocol.receive_data(data)
 
-        await self._exit_stack.enter_async_context(self._tg)
-        self._tg.start_soon(self._receive)
-        self._tg.start_soon(self._send_ping)
+            if self._protocol.handshake_exc is not None:
+                raise self._protocol.handshake_exc
+        except BaseException:
+            await anyio.aclose_forcefully(stream)
+            raise
+
+        self._stream = stream
+        self._ping_tasks.clear()
+
+    async def _run(self) -> None:
+        reconnect_event: RTAReconnectEvent | None = None
+
+        while True:
+            async with anyio.create_task_group() as tg:
+                self._connection_scope = tg.cancel_scope
+                tg.start_soon(self._receive)
+                tg.start_soon(self._send_ping)
+
+                if reconnect_event:
+                    tg.start_soon(self._resubscribe, reconnect_event)
+                else:
+                    self._connected.set()
+
+            await self._drop_connection()
+
+            # the task group can't be cancelled from here, as that would cancel
+            # whoever connected too - close() has to be called to clean up
+            if self._closed or not self.auto_reconnect:
+                self._stop()
+                return
+
+            try:
+                reconnect_event = await self._reconnect()
+            except Exception as e:
+                self._disconnect_error = e
+                self._stop()
+                return
+
+    def _stop(self) -> None:
+        self._closed = True
+
+        for event_stream in self._event_streams:
+            event_stream._end()
+
+        # wakes anything waiting for the connection, which then sees it's closed
+        self._connected.set()
+
+    async def _wait_connected(self, timeout: float | None) -> None:
+        if not self._closed:
+            with deadline(timeout):
+                await self._connected.wait()
+
+        if self._closed:
+            raise ConnectionError("Connection closed.") from self._disconnect_error
+
+    def _disconnect(self, error: Exception) -> None:
+        self._disconnect_error = error
+        if self._connection_scope is not None:
+            self._connection_scope.cancel()
+
+    async def _drop_connection(self) -> None:
+        # anything already waiting for the connection keeps waiting on the old event
+        if self._connected.is_set():
+            self._connected = anyio.Event()
+
+        if self._stream is not None:
+            await anyio.aclose_forcefully(self._stream)
+            self._stream = None
+
+        # anyone waiting on a subscription is told the connection was lost
+        for stream in tuple(self._stapled_stream_set):
+            await stream.aclose()
+
+        # replies still to come were for the old connection
+        self._subscribe_listeners.clear()
+        self._server_ids.clear()
+        for subscription in self._subscriptions.values():
+            subscription.server_id = None
+
+    async def _reconnect(self) -> RTAReconnectEvent:
+        disconnected_at = _utc_now()
+        attempts = 0
+
+        while True:
+            attempts += 1
+            delay = min(
+                RECONNECT_BASE_DELAY * 2 ** (attempts - 1), self.max_reconnect_delay
+            )
+            # "equal jitter" - wait somewhere between half and all of the delay
+            await anyio.sleep(random.uniform(delay / 2, delay))  # noqa: S311
+
+            try:
+                await self._open_connection()
+            except Exception as e:
+                traceback.print_exception(e)
+                if (
+                    self.max_reconnect_attempts is not None
+                    and attempts >= self.max_reconnect_attempts
+                ):
+                    raise
+                continue
+
+            event = RTAReconnectEvent(
+                disconnected_at=disconnected_at,
+                reconnected_at=_utc_now(),
+                attempts=attempts,
+                error=self._disconnect_error,
+            )
+            self._disconnect_error = None
+            return event
+
+    async def _resubscribe(self, reconnect_event: RTAReconnectEvent) -> None:
+        subscriptions = list(self._subscriptions.values())
+        results = await self._send_subscribes(subscriptions, SUBSCRIBE_TIMEOUT)
+
+        gap_events = [
+            RTAGapEvent(
+                subscription_id=subscription.id,
+                url=subscription.url,
+                disconnected_at=reconnect_event.disconnected_at,
+                reconnected_at=reconnect_event.reconnected_at,
+                data=None if isinstance(result, Exception) else result,
+                error=result if isinstance(result, Exception) else None,
+            )
+            for subscription, result in zip(subscriptions, results, strict=True)
+            # it may have been unsubscribed from while resubscribing
+            if subscription.id in self._subscriptions
+        ]
+
+        self._connected.set()
+
+        if self.reconnect_handler:
+            self._tg.start_soon(_run_handler, self.reconnect_handler, reconnect_event)
+        if self.gap_handler:
+            for gap_event in gap_events:
+                self._tg.start_soon(_run_handler, self.gap_handler, gap_event)
 
     async def _receive(self) -> None:
-        if not self._stream:
+        stream = self._stream
+        if not stream:
             raise ConnectionError("Stream hasn't been started yet.")
 
         try:
             while True:
                 try:
-                    data = await self._stream.receive()
+                    data = await stream.receive()
                 except anyio.EndOfStream:
                     self._protocol.receive_eof()
-                    for data in self._protocol.data_to_send():
-                        await self._stream.send(data)
+                    with contextlib.suppress(Exception):
+                        for data in self._protocol.data_to_send():
+                            await stream.send(data)
 
-                    await self.close()
-                    raise ConnectionError("Received EOF.") from None
-                except anyio.ClosedResourceError:
+                    self._disconnect(ConnectionError("Received EOF."))
+                    return
+                except (anyio.ClosedResourceError, anyio.BrokenResourceError):
+                    self._disconnect(ConnectionError("Connection closed."))
                     return
 
                 self._protocol.receive_data(data)
 
                 if self._protocol.handshake_exc is not None:
-                    await self.close()
-                    raise self._protocol.handshake_exc
+                    self._disconnect(self._protocol.handshake_exc)
+                    return
 
                 events = self._protocol.events_received()
 
                 for event in events:
                     if isinstance(event, Frame):
                         if event.opcode == Opcode.CLOSE:
-                            await self.close()
+                            self._disconnect(
+                                ConnectionError("Connection closed by the server.")
+                            )
                             return
 
                         if event.opcode == Opcode.PING:
-                            self._protocol.send_pong(event.data)
-                            for data in self._protocol.data_to_send():
-                                await self._stream.send(data)
+                            async with self._send_lock:
+                                self._protocol.send_pong(event.data)
+                                for data in self._protocol.data_to_send():
+                                    await stream.send(data)
 
                         elif (
                             event.opcode == Opcode.PONG
@@ -172,15 +620,13 @@ class RTA:
                         elif event.opcode in {Opcode.BINARY, Opcode.TEXT}:
                             await self._handle_data(event.data)
 
-        except anyio.get_cancelled_exc_class():
-            return
-
         except Exception as e:
             traceback.print_exception(e)
-            raise e
+            self._disconnect(e)
 
     async def _send_ping(self) -> None:
-        if not self._stream:
+        stream = self._stream
+        if not stream:
             raise ConnectionError("Stream hasn't been started yet.")
 
         try:
@@ -190,32 +636,34 @@ class RTA:
                 ping_id = _generate_id()
                 self._ping_tasks[ping_id] = anyio.Event()
 
-                self._protocol.send_ping(ping_id)
-                for data in self._protocol.data_to_send():
-                    await self._stream.send(data)
+                async with self._send_lock:
+                    self._protocol.send_ping(ping_id)
+                    for data in self._protocol.data_to_send():
+                        await stream.send(data)
 
                 with anyio.fail_after(PING_TIMEOUT):
                     await self._ping_tasks[ping_id].wait()
                     self._ping_tasks.pop(ping_id)
 
-        except TimeoutError:
-            print("Ping timeout.")  # noqa: T201
-            await self.close()
-
-        except anyio.get_cancelled_exc_class():
-            return
+        except TimeoutError as e:
+            self._disconnect(e)
 
         except Exception as e:
             traceback.print_exception(e)
-            raise e
+            self._disconnect(e)
 
     async def _send_str(self, data: str) -> None:
+        await self._send_strs((data,))
+
+    async def _send_strs(self, data: typing.Iterable[str]) -> None:
         if not self._stream:
             raise ConnectionError("Connection closed.")
 
-        self._protocol.send_text(data.encode())
-        for data_to_send in self._protocol.data_to_send():
-            await self._stream.send(data_to_send)
+        async with self._send_lock:
+            for message in data:
+                self._protocol.send_text(message.encode())
+            for data_to_send in self._protocol.data_to_send():
+                await self._stream.send(data_to_send)
 
     async def _handle_data(self, data: bytes) -> None:
         if not self._stream:
@@ -223,79 +671,810 @@ class RTA:
 
         parsed_data: list[typing.Any] = _loads_wrapper(data)
 
-        if parsed_data[0] == RTAType.SUBSCRIBE:
-            await self._subscribe_listeners[parsed_data[1]](parsed_data)
-        elif parsed_data[0] == RTAType.EVENT:
-            self._tg.start_soon(self._endpoint_maps[parsed_data[1]], parsed_data)
-
-    async def subscribe(
-        self,
-        url: str,
-        dispatch_handler: typing.Callable[
-            [list[typing.Any]], typing.Awaitable[typing.Any]
-        ],
+        # replies to subscriptions that timed out have nothing waiting on them
+        if parsed_data[0] == RTAType.SUBSCRIBE and (
+            listener := self._subscribe_listeners.get(parsed_data[1])
+        ):
+            await listener(parsed_data)
+        elif parsed_data[0] == RTAType.EVENT and (
+            subscription_id := self._server_ids.get(parsed_data[1])
+        ):
+            subscription = self._subscriptions[subscription_id]
+            # handlers see the ID subscribe returned, which survives reconnects
+            parsed_data[1] = subscription.id
+            await self._queue_event(subscription, parsed_data)
+
+    async def _queue_event(
+        self, subscription: _Subscription, data: list[typing.Any]
     ) -> None:
-        if not inspect.iscoroutinefunction(dispatch_handler):
-            raise ValueError("dispatch_handler must be a coroutine function.")
-
-        url = url.removesuffix("/")
-        self._last_sequence_number += 1
-        to_send = f'[{RTAType.SUBSCRIBE},{self._last_sequence_number},"{url}"]'
+        if self.overflow == "coalesce":
+            if subscription.id in self._coalesced_events:
+                self._coalesced_events[subscription.id] = data
+                self._dispatch_stats.coalesced += 1
+                return
+
+            self._coalesced_events[subscription.id] = data
+            await self._dispatch_send.send((subscription, None))
+            return
 
-        stapled_stream = StapledObjectStream(*anyio.create_memory_object_stream())
+        if self.overflow == "drop_oldest":
+            try:
+                self._dispatch_send.send_nowait((subscription, data))
+            except anyio.WouldBlock:
+                self._dispatch_receive.receive_nowait()
+                self._dispatch_stats.dropped += 1
+                self._dispatch_send.send_nowait((subscription, data))
+            return
 
-        self._subscribe_listeners[self._last_sequence_number] = functools.partial(
-            self._subscribe_handle, dispatch_handler, stapled_stream
+        await self._dispatch_send.send((subscription, data))
+
+    async def _dispatch_worker(self) -> None:
+        async for subscription, data in self._dispatch_receive:
+            if data is None:
+                data = self._coalesced_events.pop(subscription.id)
+
+            # it may have been unsubscribed from while the event was queued
+            if subscription.id not in self._subscriptions:
+                continue
+
+            self._dispatch_stats.dispatched += 1
+            try:
+                await subscription.handler(data)
+            except Exception as e:
+                traceback.print_exception(e)
+
+    def dispatch_stats(self) -> RTADispatchStats:
+        return RTADispatchStats(
+            queued=self._dispatch_receive.statistics().current_buffer_used,
+            dispatched=self._dispatch_stats.dispatched,
+            dropped=self._dispatch_stats.dropped,
+            coalesced=self._dispatch_stats.coalesced,
         )
-        await self._send_str(to_send)
 
+    async def _send_subscribes(
+        self, subscriptions: list[_Subscription], timeout: float | None
+    ) -> list[typing.Any]:
+        """
+        Send a SUBSCRIBE frame for every subscription, then wait for the replies,
+        so that the subscriptions take one round trip rather than one each.
+
+        Returns what each reply held, or the exception subscribing raised.
+        """
+        if not subscriptions:
+            return []
+
+        # every reply fits, so the receive loop never waits on this
+        stapled_stream = StapledObjectStream(
+            *anyio.create_memory_object_stream(len(subscriptions))
+        )
         self._stapled_stream_set.add(stapled_stream)
 
+        to_send: list[str] = []
+        for subscription in subscriptions:
+            self._last_sequence_number += 1
+            sequence_number = self._last_sequence_number
+
+            to_send.append(
+                f'[{RTAType.SUBSCRIBE},{sequence_number},"{subscription.url}"]'
+            )
+            self._subscribe_listeners[sequence_number] = functools.partial(
+                self._subscribe_handle, subscription, stapled_stream
+            )
+
+        results: dict[int, typing.Any] = {}
+        error: Exception | None = None
+
         try:
-            data = await stapled_stream.receive()
-        except (anyio.ClosedResourceError, anyio.EndOfStream):
-            return
+            with deadline(timeout):
+                await self._send_strs(to_send)
+                while len(results) < len(subscriptions):
+                    subscription, data = await stapled_stream.receive()
+                    results[subscription.id] = data
+        except (anyio.ClosedResourceError, anyio.EndOfStream, ConnectionError):
+            error = ConnectionError("Connection closed.")
+        except DeadlineExceeded as e:
+            error = e
+        finally:
+            # the listeners are left for replies that are still to come, so that
+            # subscriptions given up on can be unsubscribed from once they arrive
+            self._stapled_stream_set.discard(stapled_stream)
+
+        return [results.get(subscription.id, error) for subscription in subscriptions]
+
+    async def subscribe(
+        self,
+        url: str,
+        dispatch_handler: DispatchHandler,
+        *,
+        timeout: float | None = SUBSCRIBE_TIMEOUT,
+    ) -> int:
+        """
+        Subscribe to a resource, calling `dispatch_handler` with each event for it.
+
+        Waits for the connection to be back up if it is reconnecting. Returns the ID
+        of the subscription, to unsubscribe with - it doesn't change on reconnects.
+        """
+        (result,) = await self._add_subscriptions([(url, dispatch_handler)], timeout)
+        if isinstance(result, Exception):
+            raise result
+        return result[0]
+
+    async def subscribe_many(
+        self,
+        urls: typing.Iterable[str],
+        dispatch_handler: DispatchHandler,
+        *,
+        timeout: float | None = SUBSCRIBE_TIMEOUT,
+    ) -> dict[str, int | Exception]:
+        """
+        Subscribe to many resources at once, calling `dispatch_handler` with each
+        event for any of them.
+
+        Every subscription is sent before waiting for any replies, so this takes
+        about one round trip however many there are. Returns the ID of the
+        subscription for each URL, or the exception subscribing to it raised -
+        URLs that only differ by a trailing slash share one subscription.
+        """
+        # normalized first, so the same resource is only subscribed to once
+        normalized = {url: url.removesuffix("/") for url in urls}
+        unique = list(dict.fromkeys(normalized.values()))
+
+        results = await self._add_subscriptions(
+            [(url, dispatch_handler) for url in unique], timeout
+        )
+        subscribed = {
+            url: result if isinstance(result, Exception) else result[0]
+            for url, result in zip(unique, results, strict=True)
+        }
+        return {url: subscribed[normalized[url]] for url in normalized}
+
+    async def _add_subscriptions(
+        self,
+        to_add: list[tuple[str, DispatchHandler]],
+        timeout: float | None,
+    ) -> list[tuple[int, typing.Any] | Exception]:
+        for _, dispatch_handler in to_add:
+            if not inspect.iscoroutinefunction(dispatch_handler):
+                raise ValueError("dispatch_handler must be a coroutine function.")
+
+        give_up_at = None if timeout is None else anyio.current_time() + timeout
+        await self._wait_connected(timeout)
+
+        subscriptions: list[_Subscription] = []
+        for url, dispatch_handler in to_add:
+            self._last_subscription_id += 1
+            subscription = _Subscription(
+                self._last_subscription_id, url.removesuffix("/"), dispatch_handler
+            )
+            subscription.pending = True
+            subscriptions.append(subscription)
 
-        self._stapled_stream_set.discard(stapled_stream)
+        try:
+            # the deadline is given here rather than enclosing this, so running out
+            # of time fails the subscriptions still waiting rather than all of them
+            results = await self._send_subscribes(
+                subscriptions,
+                None if give_up_at is None else give_up_at - anyio.current_time(),
+            )
+        except BaseException:
+            for subscription in subscriptions:
+                subscription.pending = False
+                self._forget(subscription.id)
+            raise
+
+        for subscription in subscriptions:
+            subscription.pending = False
+
+        outcomes: list[tuple[int, typing.Any] | Exception] = []
+        for subscription, result in zip(subscriptions, results, strict=True):
+            if isinstance(result, Exception):
+                self._forget(subscription.id)
+                outcomes.append(result)
+            else:
+                outcomes.append((subscription.id, result))
+        return outcomes
 
-        if isinstance(data, Exception):
-            raise data
+    def _forget(self, subscription_id: int) -> _Subscription | None:
+        subscription = self._subscriptions.pop(subscription_id, None)
+        if subscription and subscription.server_id is not None:
+            self._server_ids.pop(subscription.server_id, None)
+        return subscription
+
+    async def subscribe_stream(
+        self,
+        url: str,
+        *,
+        max_buffer: int = MAX_QUEUED_EVENTS,
+        timeout: float | None = SUBSCRIBE_TIMEOUT,
+    ) -> RTAEventStream:
+        """
+        Subscribe to a resource, returning a stream of its events rather than
+        calling a handler with them.
+        """
+        return await RTAEventStream._subscribe(self, url, max_buffer, timeout)
 
     async def unsubscribe(self, subscription_id: int) -> None:
+        subscription = self._forget(subscription_id)
+        # without a server ID, it's unsubscribed from once the reply comes in
+        if subscription is None or subscription.server_id is None:
+            return
+
+        await self._send_unsubscribe(subscription.server_id)
+
+    async def _send_unsubscribe(self, server_id: int) -> None:
         self._last_sequence_number += 1
-        to_send = (
-            f"[{RTAType.UNSUBSCRIBE},{self._last_sequence_number}, {subscription_id}]"
-        )
+        to_send = f"[{RTAType.UNSUBSCRIBE},{self._last_sequence_number}, {server_id}]"
         await self._send_str(to_send)
-        self._endpoint_maps.pop(subscription_id, None)
 
     async def _subscribe_handle(
         self,
-        new_dispatch_handle: typing.Callable[
-            [list[typing.Any]], typing.Awaitable[typing.Any]
-        ],
+        subscription: _Subscription,
         stapled_stream: StapledObjectStream,
         data: list[typing.Any],
     ) -> None:
+        self._subscribe_listeners.pop(data[1], None)
+
         if len(data) != 5:
             if len(data) == 4:
-                await stapled_stream.send(ValueError(f"Invalid RTA: {data[3]}"))
+                error = ValueError(f"Invalid RTA: {data[3]}")
             else:
-                await stapled_stream.send(ValueError(f"Invalid RTA: {data}"))
+                error = ValueError(f"Invalid RTA: {data}")
+            await self._send_result(stapled_stream, subscription, error)
             return
 
-        self._endpoint_maps[data[3]] = new_dispatch_handle
-        self._subscribe_listeners.pop(data[1], None)
+        # it was unsubscribed from, or subscribe gave up on it, before the reply
+        # came in - the service has to be told to drop it, or it's leaked there
+        if not (
+            subscription.pending
+            or self._subscriptions.get(subscription.id) is subscription
+        ):
+            with contextlib.suppress(
+                ConnectionError, anyio.BrokenResourceError, anyio.ClosedResourceError
+            ):
+                await self._send_unsubscribe(data[3])
+            await self._send_result(
+                stapled_stream, subscription, ConnectionError("Unsubscribed.")
+            )
+            return
 
-        await stapled_stream.send(None)
+        # registered here rather than in subscribe, so that no event sent right
+        # after the reply can arrive before the subscription is known
+        subscription.server_id = data[3]
+        self._subscriptions[subscription.id] = subscription
+        self._server_ids[data[3]] = subscription.id
+
+        await self._send_result(stapled_stream, subscription, data[4])
+
+    async def _send_result(
+        self,
+        stapled_stream: StapledObjectStream,
+        subscription: _Subscription,
+        result: typing.Any,
+    ) -> None:
+        # nothing's waiting on replies that came in too late
+        with contextlib.suppress(anyio.BrokenResourceError, anyio.ClosedResourceError):
+            await stapled_stream.send((subscription, result))
 
     async def close(self) -> None:
-        if self._stream is not None:
-            await self._stream.aclose()
-            self._stream = None
+        self._stop()
 
-        for stream in self._stapled_stream_set:
-            await stream.aclose()
+        # the task group has to be exited even if this is cancelled part way
+        try:
+            if self._stream is not None:
+                await self._stream.aclose()
+                self._stream = None
+
+            for stream in tuple(self._stapled_stream_set):
+                await stream.aclose()
+        finally:
+            self._tg.cancel_scope.cancel()
+            await self._exit_stack.aclose()
+
+
+class _PoolConnection:
+    __slots__ = ("rta", "subscriptions", "pending", "down_since", "closed")
+
+    def __init__(self) -> None:
+        self.rta: RTA = None  # type: ignore # set once it's connected
+        # the connection's subscription IDs, to the pool's
+        self.subscriptions: dict[int, int] = {}
+        self.pending = 0
+        self.down_since: datetime.datetime | None = None
+        self.closed = anyio.Event()
+
+    @property
+    def load(self) -> int:
+        return len(self.subscriptions) + self.pending
+
+
+class _PoolSubscription:
+    __slots__ = ("id", "url", "handler", "connection", "local_id")
+
+    def __init__(
+        self, subscription_id: int, url: str, handler: DispatchHandler
+    ) -> None:
+        self.id = subscription_id
+        self.url = url
+        self.handler = handler
+        self.connection: _PoolConnection | None = None
+        self.local_id: int | None = None
+
+
+class RTAPool:
+    """
+    Spreads subscriptions across as many RTA connections as they need.
+
+    A connection is opened ahead of time once every other one is nearly full, and
+    connections left empty by unsubscribing are closed. A connection that stays
+    down for `failover_after` seconds while others are up is closed and its
+    subscriptions moved to the rest - `gap_handler` gets an `RTAGapEvent` for each
+    moved subscription, just like when a connection reconnects by itself.
+
+    Subscription IDs are the pool's own, and stay the same wherever the
+    subscription ends up.
+
+    Args:
+        headers: The headers to connect with, or a function returning them.
+        max_subscriptions_per_connection: How many subscriptions to put on one \
+            connection.
+        max_connections: The most connections to open, if limited.
+        placement: How to pick a connection for a subscription - the one with \
+            the fewest subscriptions (`least_loaded`), or by a hash of the URL \
+            (`hash`), falling back to the fewest if that one is full or down.
+        failover_after: How long a connection can be down before its \
+            subscriptions are moved, in seconds. `None` never moves them.
+        reconnect_handler: A coroutine function called after any connection \
+            reconnects.
+        gap_handler: A coroutine function called for each subscription after \
+            its connection reconnects, or after it's moved.
+        max_reconnect_delay: The longest to wait between reconnect attempts, in \
+            seconds.
+        max_reconnect_attempts: How many reconnect attempts in a row can fail \
+            before a connection gives up - its subscriptions are then moved to \
+            the rest, if `failover_after` isn't `None`.
+        dispatch_workers: How many events each connection can handle at once.
+        max_queued_events: How many events can wait to be handled on each \
+            connection.
+        overflow: What to do with events that arrive when a connection's queue \
+            is full - see `RTA`.
+    """
+
+    def __init__(
+        self,
+        headers: HeadersType | None = None,
+        *,
+        max_subscriptions_per_connection: int = MAX_SUBSCRIPTIONS_PER_CONNECTION,
+        max_connections: int | None = None,
+        placement: typing.Literal["least_loaded", "hash"] = "least_loaded",
+        failover_after: float | None = FAILOVER_AFTER,
+        reconnect_handler: (
+            typing.Callable[[RTAReconnectEvent], typing.Awaitable[typing.Any]] | None
+        ) = None,
+        gap_handler: (
+            typing.Callable[[RTAGapEvent], typing.Awaitable[typing.Any]] | None
+        ) = None,
+        max_reconnect_delay: float = RECONNECT_MAX_DELAY,
+        max_reconnect_attempts: int | None = MAX_RECONNECT_ATTEMPTS,
+        dispatch_workers: int = DISPATCH_WORKERS,
+        max_queued_events: int = MAX_QUEUED_EVENTS,
+        overflow: OverflowPolicy = "block",
+    ) -> None:
+        if placement not in {"least_loaded", "hash"}:
+            raise ValueError("placement must be 'least_loaded' or 'hash'.")
+        for handler in (reconnect_handler, gap_handler):
+            if handler is not None and not inspect.iscoroutinefunction(handler):
+                raise ValueError("Event handlers must be coroutine functions.")
+
+        self._headers = headers
+        self.max_subscriptions_per_connection = max_subscriptions_per_connection
+        self.max_connections = max_connections
+        self.placement = placement
+        self.failover_after = failover_after
+        self.reconnect_handler = reconnect_handler
+        self.gap_handler = gap_handler
+        self.max_reconnect_delay = max_reconnect_delay
+        self.max_reconnect_attempts = max_reconnect_attempts
+        self.dispatch_workers = dispatch_workers
+        self.max_queued_events = max_queued_events
+        self.overflow = overflow
+
+        self._tg = anyio.create_task_group()
+        self._exit_stack = contextlib.AsyncExitStack()
+        self._lock = anyio.Lock()
+        self._growing = False
+
+        self._connections: list[_PoolConnection] = []
+        self._subscriptions: dict[int, _PoolSubscription] = {}
+        self._last_subscription_id = 0
+        self._event_streams: set[RTAEventStream] = set()
+
+    @classmethod
+    async def establish(
+        cls, headers: HeadersType | None = None, **kwargs: typing.Any
+    ) -> typing.Self:
+        self = cls(headers=headers, **kwargs)
+        await self.connect()
+        return self
+
+    def loads(self) -> list[int]:
+        """How many subscriptions each connection has."""
+        return [connection.load for connection in self._connections]
+
+    def dispatch_stats(self) -> RTADispatchStats:
+        """The dispatch stats of every open connection, added together."""
+        stats = RTADispatchStats()
+        for connection in self._connections:
+            connection_stats = connection.rta.dispatch_stats()
+            stats.queued += connection_stats.queued
+            stats.dispatched += connection_stats.dispatched
+            stats.dropped += connection_stats.dropped
+            stats.coalesced += connection_stats.coalesced
+        return stats
+
+    async def connect(self) -> None:
+        await self._exit_stack.enter_async_context(self._tg)
+
+        try:
+            async with self._lock:
+                await self._add_connection()
+        except BaseException:
+            await self._exit_stack.aclose()
+            raise
+
+        if self.failover_after is not None:
+            self._tg.start_soon(self._watch)
+
+    async def _add_connection(self) -> _PoolConnection:
+        if (
+            self.max_connections is not None
+            and len(self._connections) >= self.max_connections
+        ):
+            raise RuntimeError("The RTA pool can't open any more connections.")
+
+        connection = _PoolConnection()
+        await self._tg.start(self._run_connection, connection)
+        self._connections.append(connection)
+        return connection
+
+    async def _run_connection(
+        self,
+        connection: _PoolConnection,
+        *,
+        task_status: anyio.abc.TaskStatus[None] = anyio.TASK_STATUS_IGNORED,
+    ) -> None:
+        # an RTA has to be closed by the same task that connected it, so each one
+        # gets a task of its own
+        connection.rta = await RTA.establish(
+            self._headers,
+            reconnect_handler=self.reconnect_handler,
+            gap_handler=(
+                functools.partial(self._forward_gap, connection)
+                if self.gap_handler
+                else None
+            ),
+            max_reconnect_delay=self.max_reconnect_delay,
+            max_reconnect_attempts=self.max_reconnect_attempts,
+            dispatch_workers=self.dispatch_workers,
+            max_queued_events=self.max_queued_events,
+            overflow=self.overflow,
+        )
+        task_status.started()
+
+        try:
+            await connection.closed.wait()
+        finally:
+            await connection.rta.close()
+
+    def _retire(self, connection: _PoolConnection) -> None:
+        if connection in self._connections:
+            self._connections.remove(connection)
+        connection.closed.set()
+
+    def _pick(self, url: str) -> _PoolConnection | None:
+        available = [
+            connection
+            for connection in self._connections
+            if connection.load < self.max_subscriptions_per_connection
+            and not connection.rta.closed
+        ]
+        if not available:
+            return None
+
+        # a connection that's reconnecting is only used if nothing else is up
+        candidates = [c for c in available if c.rta.connected] or available
+
+        if self.placement == "hash":
+            preferred = self._connections[
+                zlib.crc32(url.encode()) % len(self._connections)
+            ]
+            if preferred in candidates:
+                return preferred
+
+        return min(candidates, key=lambda c: c.load)
+
+    def _should_grow(self) -> bool:
+        if self._growing or (
+            self.max_connections is not None
+            and len(self._connections) >= self.max_connections
+        ):
+            return False
+
+        connected = [c for c in self._connections if c.rta.connected]
+        threshold = self.max_subscriptions_per_connection * POOL_GROW_THRESHOLD
+        return bool(connected) and all(c.load >= threshold for c in connected)
+
+    async def _grow(self) -> None:
+        try:
+            async with self._lock:
+                if self._should_grow():
+                    await self._add_connection()
+        except Exception:  # noqa: S110
+            # subscribing opens one itself if it turns out to be needed
+            pass
+        finally:
+            self._growing = False
+
+    async def _reserve(self, url: str) -> _PoolConnection:
+        async with self._lock:
+            connection = self._pick(url) or await self._add_connection()
+            connection.pending += 1
+
+        if self._should_grow():
+            self._growing = True
+            self._tg.start_soon(self._grow)
+
+        return connection
+
+    async def _place(
+        self, subscriptions: list[_PoolSubscription], timeout: float | None
+    ) -> list[typing.Any]:
+        """
+        Put each subscription on a connection, subscribing to those on the same
+        connection all at once.
+
+        Returns what subscribing to each returned, or the exception it raised.
+        """
+        give_up_at = None if timeout is None else anyio.current_time() + timeout
+        groups: dict[_PoolConnection, list[_PoolSubscription]] = {}
+        results: dict[int, typing.Any] = {}
+
+        try:
+            with deadline(timeout):
+                for subscription in subscriptions:
+                    try:
+                        connection = await self._reserve(subscription.url)
+                    except Exception as e:
+                        results[subscription.id] = e
+                        continue
+
+                    groups.setdefault(connection, []).append(subscription)
+        except BaseException:
+            for connection, group in groups.items():
+                connection.pending -= len(group)
+            raise
+
+        remaining = None if give_up_at is None else give_up_at - anyio.current_time()
+        async with anyio.create_task_group() as tg:
+            for connection, group in groups.items():
+                tg.start_soon(self._place_group, connection, group, remaining, results)
+
+        return [results[subscription.id] for subscription in subscriptions]
+
+    async def _place_group(
+        self,
+        connection: _PoolConnection,
+        group: list[_PoolSubscription],
+        timeout: float | None,
+        results: dict[int, typing.Any],
+    ) -> None:
+        try:
+            outcomes = await connection.rta._add_subscriptions(
+                [
+                    (subscription.url, functools.partial(self._dispatch, subscription))
+                    for subscription in group
+                ],
+                timeout,
+            )
+        except Exception as e:
+            outcomes = [e] * len(group)
+        finally:
+            connection.pending -= len(group)
+
+        for subscription, outcome in zip(group, outcomes, strict=True):
+            if not isinstance(outcome, Exception) and connection.closed.is_set():
+                outcome = ConnectionError("Connection closed.")
+
+            if isinstance(outcome, Exception):
+                results[subscription.id] = outcome
+                continue
+
+            local_id, results[subscription.id] = outcome
+            subscription.connection = connection
+            subscription.local_id = local_id
+            connection.subscriptions[local_id] = subscription.id
+
+    async def _dispatch(
+        self, subscription: _PoolSubscription, data: list[typing.Any]
+    ) -> None:
+        data[1] = subscription.id
+        await subscription.handler(data)
+
+    async def _forward_gap(
+        self, connection: _PoolConnection, gap_event: RTAGapEvent
+    ) -> None:
+        if (
+            subscription_id := connection.subscriptions.get(gap_event.subscription_id)
+        ) is None:
+            return
+
+        gap_event.subscription_id = subscription_id
+        await self.gap_handler(gap_event)  # type: ignore
+
+    async def _watch(self) -> None:
+        while True:
+            await anyio.sleep(self.failover_after / 4)  # type: ignore
+
+            now = _utc_now()
+            for connection in tuple(self._connections):
+                if connection.rta.closed:
+                    # it gave up reconnecting, so there's no point waiting
+                    connection.down_since = connection.down_since or now
+                    await self._failover(connection)
+                elif connection.rta.connected:
+                    connection.down_since = None
+                elif connection.down_since is None:
+                    connection.down_since = now
+                elif (
+                    now - connection.down_since
+                ).total_seconds() >= self.failover_after and any(  # type: ignore
+                    c.rta.connected for c in self._connections
+                ):
+                    # others being up means it's this connection that's the
+                    # problem, not the service
+                    await self._failover(connection)
+
+    async def _failover(self, connection: _PoolConnection) -> None:
+        self._retire(connection)
+        disconnected_at = connection.down_since or _utc_now()
+
+        moved = [
+            self._subscriptions[subscription_id]
+            for subscription_id in connection.subscriptions.values()
+            if subscription_id in self._subscriptions
+        ]
+        connection.subscriptions.clear()
+
+        for subscription in moved:
+            subscription.connection = None
+            subscription.local_id = None
+
+        try:
+            results = await self._place(moved, SUBSCRIBE_TIMEOUT)
+        except Exception as e:
+            results = [e] * len(moved)
+        reconnected_at = _utc_now()
+
+        for subscription, result in zip(moved, results, strict=True):
+            failed = isinstance(result, Exception)
+            if failed:
+                # there's nowhere left to put it
+                self._subscriptions.pop(subscription.id, None)
+
+            if self.gap_handler:
+                self._tg.start_soon(
+                    _run_handler,
+                    self.gap_handler,
+                    RTAGapEvent(
+                        subscription_id=subscription.id,
+                        url=subscription.url,
+                        disconnected_at=disconnected_at,
+                        reconnected_at=reconnected_at,
+                        data=None if failed else result,
+                        error=result if failed else None,
+                    ),
+                )
+
+    async def subscribe(
+        self,
+        url: str,
+        dispatch_handler: DispatchHandler,
+        *,
+        timeout: float | None = SUBSCRIBE_TIMEOUT,
+    ) -> int:
+        """
+        Subscribe to a resource, calling `dispatch_handler` with each event for it.
+
+        Returns the ID of the subscription, to unsubscribe with.
+        """
+        if not inspect.iscoroutinefunction(dispatch_handler):
+            raise ValueError("dispatch_handler must be a coroutine function.")
+
+        self._last_subscription_id += 1
+        subscription = _PoolSubscription(
+            self._last_subscription_id, url.removesuffix("/"), dispatch_handler
+        )
+
+        (result,) = await self._place([subscription], timeout)
+        if isinstance(result, Exception):
+            raise result
+
+        self._subscriptions[subscription.id] = subscription
+        return subscription.id
+
+    async def subscribe_many(
+        self,
+        urls: typing.Iterable[str],
+        dispatch_handler: DispatchHandler,
+        *,
+        timeout: float | None = SUBSCRIBE_TIMEOUT,
+    ) -> dict[str, int | Exception]:
+        """
+        Subscribe to many resources at once, calling `dispatch_handler` with each
+        event for any of them.
+
+        The subscriptions for each connection are sent together - see
+        `RTA.subscribe_many`. Returns the ID of the subscription for each URL, or
+        the exception subscribing to it raised - URLs that only differ by a
+        trailing slash share one subscription.
+        """
+        if not inspect.iscoroutinefunction(dispatch_handler):
+            raise ValueError("dispatch_handler must be a coroutine function.")
+
+        # normalized first, so the same resource is only subscribed to once
+        normalized = {url: url.removesuffix("/") for url in urls}
+        subscriptions: dict[str, _PoolSubscription] = {}
+        for url in normalized.values():
+            if url not in subscriptions:
+                self._last_subscription_id += 1
+                subscriptions[url] = _PoolSubscription(
+                    self._last_subscription_id, url, dispatch_handler
+                )
+
+        results = await self._place(list(subscriptions.values()), timeout)
+
+        subscribed: dict[str, int | Exception] = {}
+        for (url, subscription), result in zip(
+            subscriptions.items(), results, strict=True
+        ):
+            if isinstance(result, Exception):
+                subscribed[url] = result
+            else:
+                self._subscriptions[subscription.id] = subscription
+                subscribed[url] = subscription.id
+        return {url: subscribed[normalized[url]] for url in normalized}
+
+    async def subscribe_stream(
+        self,
+        url: str,
+        *,
+        max_buffer: int = MAX_QUEUED_EVENTS,
+        timeout: float | None = SUBSCRIBE_TIMEOUT,
+    ) -> RTAEventStream:
+        """
+        Subscribe to a resource, returning a stream of its events rather than
+        calling a handler with them.
+        """
+        return await RTAEventStream._subscribe(self, url, max_buffer, timeout)
+
+    async def unsubscribe(self, subscription_id: int) -> None:
+        subscription = self._subscriptions.pop(subscription_id, None)
+        if subscription is None or subscription.connection is None:
+            return
+
+        connection = subscription.connection
+        connection.subscriptions.pop(subscription.local_id, None)  # type: ignore
+
+        if connection.load == 0 and len(self._connections) > 1:
+            self._retire(connection)
+        else:
+            await connection.rta.unsubscribe(subscription.local_id)  # type: ignore
+
+    async def close(self) -> None:
+        for event_stream in self._event_streams:
+            event_stream._end()
+
+        for connection in tuple(self._connections):
+            self._retire(connection)
 
         self._tg.cancel_scope.cancel()
         await self._exit_stack.aclose()
@@ -28,8 +28,12 @@ from elytra.protocols import HandlerProtocol
 
 __all__ = ("SocialHandler",)
 
+HEADERS = {"x-xbl-contract-version": "2"}
+
 
 class SocialHandler(HandlerProtocol):
+    HOSTS: tuple[str, ...] = ("social.xboxlive.com",)
+
     @typing.overload
     async def add_friend(self, *, xuid: str | int, **kwargs: typing.Any) -> None: ...
 
@@ -50,7 +54,6 @@ class SocialHandler(HandlerProtocol):
 
         identifier = f"xuid({xuid})" if xuid else f"gt({gamertag})"
         url = f"https://social.xboxlive.com/users/me/people/{identifier}"
-        HEADERS = {"x-xbl-contract-version": "2"}
         await self.put(url, headers=HEADERS, **kwargs)
 
     @typing.overload
@@ -73,5 +76,4 @@ class SocialHandler(HandlerProtocol):
 
         identifier = f"xuid({xuid})" if xuid else f"gt({gamertag})"
         url = f"https://social.xboxlive.com/users/me/people/{identifier}"
-        HEADERS = {"x-xbl-contract-version": "2"}
         await self.delete(url, headers=HEADERS, **kwargs)
@@ -0,0 +1,96 @@
+"""
+MIT License
+
+Copyright (c) 2023-2024 AstreaTSS
+
+Permission is hereby granted, free of charge, to any person obtaining a copy
+of this software and associated documentation files (the "Software"), to deal
+in the Software without restriction, including without limitation the rights
+to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+copies of the Software, and to permit persons to whom the Software is
+furnished to do so, subject to the following conditions:
+
+The above copyright notice and this permission notice shall be included in all
+copies or substantial portions of the Software.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+SOFTWARE.
+"""
+
+# compares building the headers of a request the way BaseMicrosoftAPI.request used
+# to - merging the handler's headers with base_headers on every call - with the
+# prepared headers it reuses until the XSTS token changes
+# run with elytra installed: python tests/benchmark_prepared_headers.py
+
+import collections
+import timeit
+import typing
+
+import anyio
+import httpx
+from mock_auth import make_handler, oauth_token
+
+from elytra import XboxAPI
+from elytra.const import XBOX_API_RELYING_PARTY
+from elytra.core import AuthenticationManager
+from elytra.xbox.profile import HEADERS
+
+NUMBER = 200_000
+
+
+async def _api() -> XboxAPI:
+    session = httpx.AsyncClient(
+        transport=httpx.MockTransport(make_handler(collections.Counter(), delay=0))
+    )
+    auth_mgr = AuthenticationManager(
+        session, "client-id", "client-secret", XBOX_API_RELYING_PARTY
+    )
+    auth_mgr.oauth = oauth_token(expired=True)
+    await auth_mgr.refresh_tokens()
+    return XboxAPI(session, auth_mgr)
+
+
+def _merged_headers(
+    api: XboxAPI, headers: typing.Optional[dict], is_json: bool
+) -> dict[str, typing.Any]:
+    # what request did for every call before headers were prepared
+    headers = dict(headers) if headers else {}
+    if is_json:
+        headers["Content-Type"] = "application/json"
+
+    return {
+        "method": "POST",
+        "url": "https://profile.xboxlive.com/users/batch/profile/settings",
+        "headers": headers | api.base_headers,
+        "data": None,
+        "params": {},
+    } | {"content": b"{}"}
+
+
+def main() -> None:
+    api = anyio.run(_api)
+
+    for is_json in (False, True):
+        merged = timeit.timeit(
+            lambda is_json=is_json: _merged_headers(api, HEADERS, is_json),
+            number=NUMBER,
+        )
+        prepared = timeit.timeit(
+            lambda is_json=is_json: api._prepare_headers(HEADERS, is_json),
+            number=NUMBER,
+        )
+
+        print(  # noqa: T201
+            f"json={is_json}: merged {merged / NUMBER * 1e6:.3f}us,"
+            f" prepared {prepared / NUMBER * 1e6:.3f}us per request"
+            f" ({merged / prepared:.1f}x)"
+        )
+
+
+if __name__ == "__main__":
+    main()
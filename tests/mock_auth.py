@@ -0,0 +1,110 @@
+"""
+MIT License
+
+Copyright (c) 2023-2024 AstreaTSS
+
+Permission is hereby granted, free of charge, to any person obtaining a copy
+of this software and associated documentation files (the "Software"), to deal
+in the Software without restriction, including without limitation the rights
+to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+copies of the Software, and to permit persons to whom the Software is
+furnished to do so, subject to the following conditions:
+
+The above copyright notice and this permission notice shall be included in all
+copies or substantial portions of the Software.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+SOFTWARE.
+"""
+
+import collections
+import datetime
+import json
+import typing
+
+import anyio
+import httpx
+
+from elytra.core import OAuth2TokenResponse
+
+AUTH_HOSTS = ("login.live.com", "user.auth.xboxlive.com", "xsts.auth.xboxlive.com")
+
+Handler = typing.Callable[[httpx.Request], typing.Awaitable[httpx.Response]]
+
+
+def _utc_now() -> datetime.datetime:
+    return datetime.datetime.now(datetime.timezone.utc)
+
+
+def make_handler(
+    counts: collections.Counter,
+    delay: float = 0.05,
+    failing_hosts: typing.Container[str] = (),
+) -> Handler:
+    """
+    Stand in for the Microsoft and Xbox Live auth services, counting the requests
+    made to each host in `counts`. Every response takes `delay` seconds, so that
+    concurrent callers overlap, and hosts in `failing_hosts` return a 500.
+    """
+
+    async def handler(request: httpx.Request) -> httpx.Response:
+        host = request.url.host
+        counts[host] += 1
+        await anyio.sleep(delay)
+
+        if host in failing_hosts:
+            return httpx.Response(500)
+
+        if host == "login.live.com":
+            return httpx.Response(
+                200,
+                json={
+                    "token_type": "bearer",
+                    "expires_in": 3600,
+                    "scope": "service::user.auth.xboxlive.com::MBI_SSL",
+                    "access_token": f"access-{counts[host]}",
+                    "refresh_token": f"refresh-{counts[host]}",
+                },
+            )
+
+        if host in {"user.auth.xboxlive.com", "xsts.auth.xboxlive.com"}:
+            relying_party = json.loads(request.content)["RelyingParty"]
+            return httpx.Response(
+                200,
+                json={
+                    "IssueInstant": _utc_now().isoformat(),
+                    "NotAfter": (_utc_now() + datetime.timedelta(hours=16)).isoformat(),
+                    "Token": f"{host}-{counts[host]}-{relying_party}",
+                    "DisplayClaims": {
+                        "xui": [{"uhs": "userhash", "xid": "2535", "gtg": "Gamer"}]
+                    },
+                },
+            )
+
+        return httpx.Response(404)
+
+    return handler
+
+
+def oauth_bytes(expired: bool = True) -> bytes:
+    """An OAuth token, as the JSON `elytra-authenticate` writes."""
+    issued = _utc_now() - datetime.timedelta(hours=2 if expired else 0)
+    return json.dumps(
+        {
+            "token_type": "bearer",
+            "expires_in": 3600,
+            "scope": "service::user.auth.xboxlive.com::MBI_SSL",
+            "access_token": "access-0",
+            "refresh_token": "refresh-0",
+            "issued": issued.isoformat(),
+        }
+    ).encode()
+
+
+def oauth_token(expired: bool = True) -> OAuth2TokenResponse:
+    return OAuth2TokenResponse.from_bytes(oauth_bytes(expired))
@@ -0,0 +1,69 @@
+"""
+MIT License
+
+Copyright (c) 2023-2024 AstreaTSS
+
+Permission is hereby granted, free of charge, to any person obtaining a copy
+of this software and associated documentation files (the "Software"), to deal
+in the Software without restriction, including without limitation the rights
+to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+copies of the Software, and to permit persons to whom the Software is
+furnished to do so, subject to the following conditions:
+
+The above copyright notice and this permission notice shall be included in all
+copies or substantial portions of the Software.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+SOFTWARE.
+"""
+
+import anyio
+import pytest
+
+from elytra.priorities import Priority, PrioritySemaphore
+
+pytestmark = pytest.mark.anyio
+
+
+async def test_cancelled_acquire_keeps_slot() -> None:
+    semaphore = PrioritySemaphore(1)
+
+    with anyio.move_on_after(0):
+        await semaphore.acquire()
+
+    assert semaphore.value == 1
+    with anyio.fail_after(1):
+        async with semaphore.hold():
+            pass
+
+
+async def test_cancelled_waiter_keeps_slot() -> None:
+    semaphore = PrioritySemaphore(1)
+
+    async with semaphore.hold():
+        with anyio.move_on_after(0.05):
+            await semaphore.acquire(Priority.INTERACTIVE)
+
+    assert semaphore.value == 1
+    assert not semaphore.waiting
+
+
+async def test_higher_priority_goes_first() -> None:
+    semaphore = PrioritySemaphore(1)
+    order: list[Priority] = []
+
+    async def wait(value: Priority) -> None:
+        async with semaphore.hold(value):
+            order.append(value)
+
+    async with anyio.create_task_group() as tg, semaphore.hold():
+        for value in (Priority.BACKGROUND, Priority.NORMAL, Priority.INTERACTIVE):
+            tg.start_soon(wait, value)
+            await anyio.wait_all_tasks_blocked()
+
+    assert order == [Priority.INTERACTIVE, Priority.NORMAL, Priority.BACKGROUND]
@@ -0,0 +1,74 @@
+"""
+MIT License
+
+Copyright (c) 2023-2024 AstreaTSS
+
+Permission is hereby granted, free of charge, to any person obtaining a copy
+of this software and associated documentation files (the "Software"), to deal
+in the Software without restriction, including without limitation the rights
+to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+copies of the Software, and to permit persons to whom the Software is
+furnished to do so, subject to the following conditions:
+
+The above copyright notice and this permission notice shall be included in all
+copies or substantial portions of the Software.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+SOFTWARE.
+"""
+
+import collections
+
+import anyio
+import httpx
+import pytest
+
+from elytra.retry_transport import RetryTransport
+from elytra.session import StreamLimitTransport
+
+pytestmark = pytest.mark.anyio
+
+HOST = "profile.xboxlive.com"
+
+
+@pytest.mark.parametrize("error", [httpx.ConnectError, RuntimeError])
+async def test_failing_policy_releases_response(error: type[Exception]) -> None:
+    counts: collections.Counter = collections.Counter()
+
+    async def handler(request: httpx.Request) -> httpx.Response:
+        counts[request.url.host] += 1
+        return httpx.Response(401)
+
+    async def refresh_on_unauthorized(*_: object) -> None:
+        raise error("Refreshing the token failed.")
+
+    stream_limit = StreamLimitTransport(
+        httpx.MockTransport(handler),  # type: ignore
+        max_streams_per_host=1,
+    )
+    session = httpx.AsyncClient(
+        transport=RetryTransport(wrapped_transport=stream_limit, backoff_factor=0)
+    )
+
+    # retrying would wait forever on the stream the leaked response holds
+    with pytest.raises(error), anyio.fail_after(1):
+        await session.get(
+            f"https://{HOST}/users/me",
+            extensions={"retry_policy": refresh_on_unauthorized},
+        )
+
+    # the policy failing isn't a transport error, so it isn't retried
+    assert counts[HOST] == 1
+    state = stream_limit._hosts[HOST]
+    assert state.active == 0
+    assert state.semaphore is not None
+    assert state.semaphore.value == 1
+
+    with anyio.fail_after(1):
+        await session.get(f"https://{HOST}/users/me")
+    await session.aclose()
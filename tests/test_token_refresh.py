@@ -0,0 +1,113 @@
+"""
+MIT License
+
+Copyright (c) 2023-2024 AstreaTSS
+
+Permission is hereby granted, free of charge, to any person obtaining a copy
+of this software and associated documentation files (the "Software"), to deal
+in the Software without restriction, including without limitation the rights
+to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+copies of the Software, and to permit persons to whom the Software is
+furnished to do so, subject to the following conditions:
+
+The above copyright notice and this permission notice shall be included in all
+copies or substantial portions of the Software.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+SOFTWARE.
+"""
+
+import collections
+import typing
+
+import anyio
+import httpx
+import pytest
+from mock_auth import AUTH_HOSTS, make_handler, oauth_token
+
+from elytra.const import XBOX_API_RELYING_PARTY
+from elytra.core import AuthenticationManager
+
+pytestmark = pytest.mark.anyio
+
+CONCURRENT_CALLERS = 100
+
+
+def _auth_mgr(
+    counts: collections.Counter,
+    failing_hosts: typing.Container[str] = (),
+    additional_relying_parties: typing.Iterable[str] = (),
+) -> AuthenticationManager:
+    session = httpx.AsyncClient(
+        transport=httpx.MockTransport(make_handler(counts, failing_hosts=failing_hosts))
+    )
+    auth_mgr = AuthenticationManager(
+        session,
+        "client-id",
+        "client-secret",
+        XBOX_API_RELYING_PARTY,
+        additional_relying_parties=additional_relying_parties,
+    )
+    auth_mgr.oauth = oauth_token(expired=True)
+    return auth_mgr
+
+
+async def test_concurrent_refreshes_share_one_request() -> None:
+    counts: collections.Counter = collections.Counter()
+    auth_mgr = _auth_mgr(counts)
+
+    async with anyio.create_task_group() as tg:
+        for _ in range(CONCURRENT_CALLERS):
+            tg.start_soon(auth_mgr.refresh_tokens)
+
+    assert counts == {host: 1 for host in AUTH_HOSTS}
+    assert auth_mgr._tokens_valid()
+    await auth_mgr.close()
+
+
+async def test_concurrent_forced_refreshes_share_one_request() -> None:
+    counts: collections.Counter = collections.Counter()
+    auth_mgr = _auth_mgr(counts)
+    await auth_mgr.refresh_tokens()
+    counts.clear()
+
+    async with anyio.create_task_group() as tg:
+        for _ in range(CONCURRENT_CALLERS):
+            tg.start_soon(auth_mgr.refresh_tokens, True)
+
+    assert counts == {host: 1 for host in AUTH_HOSTS}
+    await auth_mgr.close()
+
+
+async def test_valid_tokens_are_not_refreshed() -> None:
+    counts: collections.Counter = collections.Counter()
+    auth_mgr = _auth_mgr(counts)
+    await auth_mgr.refresh_tokens()
+    counts.clear()
+
+    async with anyio.create_task_group() as tg:
+        for _ in range(CONCURRENT_CALLERS):
+            tg.start_soon(auth_mgr.refresh_tokens)
+
+    assert not counts
+    await auth_mgr.close()
+
+
+@pytest.mark.parametrize("additional_relying_parties", [(), ("rp://other",)])
+async def test_failed_xsts_refresh_raises_status_error(
+    additional_relying_parties: tuple[str, ...],
+) -> None:
+    auth_mgr = _auth_mgr(
+        collections.Counter(),
+        failing_hosts={"xsts.auth.xboxlive.com"},
+        additional_relying_parties=additional_relying_parties,
+    )
+
+    with pytest.raises(httpx.HTTPStatusError):
+        await auth_mgr.refresh_tokens()
+    await auth_mgr.close()
@@ -0,0 +1,99 @@
+"""
+MIT License
+
+Copyright (c) 2023-2024 AstreaTSS
+
+Permission is hereby granted, free of charge, to any person obtaining a copy
+of this software and associated documentation files (the "Software"), to deal
+in the Software without restriction, including without limitation the rights
+to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+copies of the Software, and to permit persons to whom the Software is
+furnished to do so, subject to the following conditions:
+
+The above copyright notice and this permission notice shall be included in all
+copies or substantial portions of the Software.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+SOFTWARE.
+"""
+
+import collections
+import multiprocessing
+import multiprocessing.synchronize
+import pathlib
+
+import anyio
+import httpx
+from mock_auth import AUTH_HOSTS, make_handler, oauth_bytes
+
+from elytra import SharedFileTokenStore
+from elytra.const import XBOX_API_RELYING_PARTY
+from elytra.core import AuthenticationManager
+
+WORKERS = 8
+
+
+def _worker(
+    path: str,
+    barrier: multiprocessing.synchronize.Barrier,
+    results: multiprocessing.Queue,
+) -> None:
+    async def main() -> None:
+        counts: collections.Counter = collections.Counter()
+        # slow enough that every worker is waiting while the first one refreshes
+        session = httpx.AsyncClient(
+            transport=httpx.MockTransport(make_handler(counts, delay=0.2))
+        )
+
+        barrier.wait()
+        auth_mgr = await AuthenticationManager.from_token_store(
+            session,
+            "client-id",
+            "client-secret",
+            XBOX_API_RELYING_PARTY,
+            SharedFileTokenStore(path),
+        )
+
+        results.put(
+            (
+                dict(counts),
+                auth_mgr.xsts_tokens[XBOX_API_RELYING_PARTY].token,
+                auth_mgr._tokens_valid(),
+            )
+        )
+        await auth_mgr.close()
+
+    anyio.run(main)
+
+
+def test_one_process_refreshes(tmp_path: pathlib.Path) -> None:
+    path = tmp_path / "tokens.json"
+    path.write_bytes(oauth_bytes(expired=True))
+
+    barrier = multiprocessing.Barrier(WORKERS)
+    results: multiprocessing.Queue = multiprocessing.Queue()
+    processes = [
+        multiprocessing.Process(target=_worker, args=(str(path), barrier, results))
+        for _ in range(WORKERS)
+    ]
+    for process in processes:
+        process.start()
+
+    outcomes = [results.get(timeout=30) for _ in processes]
+    for process in processes:
+        process.join(timeout=30)
+        assert process.exitcode == 0
+
+    counts: collections.Counter = collections.Counter()
+    for worker_counts, _, _ in outcomes:
+        counts.update(worker_counts)
+
+    assert counts == {host: 1 for host in AUTH_HOSTS}
+    # everyone ends up with the token the one refreshing process fetched
+    assert len({xsts_token for _, xsts_token, _ in outcomes}) == 1
+    assert all(valid for _, _, valid in outcomes)